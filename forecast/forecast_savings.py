@@ -0,0 +1,250 @@
+import io
+import os
+import time
+import pydub
+from PIL import Image
+from sourcepp import vtfpp
+from material_compression.vtfheader import read_vtf_header
+from sound_compression.riff import scan_wav
+from unused_files.find_duplicates import calculate_quick_hash
+from utils.formatting import format_size, format_percentage
+from utils.vpk import get_vpk_files
+
+# Vorbis -q:a 4 is roughly 64 kbit/s per channel, used when no sample could be encoded
+FALLBACK_OGG_BYTES_PER_CHANNEL_SECOND = 8000
+
+OPERATIONS = [
+    "Clamp VTF file sizes",
+    "Use DXT for VTFs",
+    "Remove mipmaps",
+    "Clamp PNG file sizes",
+    ".wav to .ogg",
+    "Find duplicate files",
+    "Remove files already in game",
+]
+
+
+def _vtf_data_length(image_format, width, height, depth, mip_count, frame_count, face_count):
+    """Size of the image data of a VTF with these properties, all mips, frames and faces."""
+    length = 0
+    for mip in range(max(mip_count, 1)):
+        mip_width, mip_height, mip_depth = vtfpp.ImageDimensions.get_mip_dims(mip, width, height, depth)
+        length += vtfpp.ImageFormatDetails.get_data_length(image_format, mip_width, mip_height, mip_depth)
+    return length * max(frame_count, 1) * max(face_count, 1)
+
+
+def _forecast_vtf(file_path, file_size, clamp_size):
+    """Predicted savings of the clamp, DXT and mipmap operations for a single VTF, using only its header."""
+    vtf = read_vtf_header(file_path)
+    if vtf.format is None:
+        return {}
+    width, height, depth = vtf.width, vtf.height, vtf.depth
+    mip_count, frame_count, face_count = vtf.mip_count, vtf.frame_count, vtf.face_count
+
+    current_length = _vtf_data_length(vtf.format, width, height, depth, mip_count, frame_count, face_count)
+    # Header, thumbnail and other resources stay the same size
+    overhead = max(file_size - current_length, 0)
+
+    best_format = vtfpp.ImageFormat.DXT1
+    if vtf.has_alpha_flags:
+        best_format = vtfpp.ImageFormat.DXT5
+
+    def cleanup_savings(max_size):
+        new_width, new_height = width, height
+        if width > max_size or height > max_size:
+            scale = max_size / max(width, height)
+            new_width, new_height = int(width * scale), int(height * scale)
+        if vtf.format == best_format and (new_width, new_height) == (width, height):
+            return 0
+        new_mips = min(mip_count, vtfpp.ImageDimensions.get_maximum_mip_count(new_width, new_height, depth))
+        new_length = _vtf_data_length(best_format, new_width, new_height, depth, new_mips, frame_count, face_count)
+        return max(file_size - (overhead + new_length), 0)
+
+    mip_savings = 0
+    if mip_count > 1:
+        mip_savings = current_length - _vtf_data_length(vtf.format, width, height, depth, 1, frame_count, face_count)
+
+    return {
+        "Clamp VTF file sizes": cleanup_savings(clamp_size),
+        "Use DXT for VTFs": cleanup_savings(1_000_000),
+        "Remove mipmaps": mip_savings,
+    }
+
+
+def _forecast_png(file_path, file_size, max_size):
+    # Image.open only reads the header, the pixels are never decoded here
+    with Image.open(file_path) as image:
+        w, h = image.size
+    if w <= max_size and h <= max_size:
+        return 0
+    scale = max_size / max(w, h)
+    new_pixels = int(w * scale) * int(h * scale)
+    return int(file_size * (1 - new_pixels / (w * h)))
+
+
+def _wav_plan(file_path):
+    """Returns (channels, seconds) of a WAV that wav_to_ogg would convert, or None if it'd be skipped."""
+    wav_info = scan_wav(file_path)
+    if wav_info.has_cues or wav_info.has_loops:
+        return None
+    return wav_info.channel_count, wav_info.duration
+
+
+def _ogg_bytes_per_channel_second(plans, sample_count):
+    """Encode a few WAVs spread over the size range and return the average OGG size per channel second."""
+    if not plans:
+        return FALLBACK_OGG_BYTES_PER_CHANNEL_SECOND
+
+    ordered = sorted(plans, key=lambda plan: plan[1])
+    step = max(len(ordered) // sample_count, 1)
+    samples = ordered[step // 2::step][:sample_count]
+
+    encoded_bytes = 0
+    channel_seconds = 0
+    for file_path, _, channels, seconds in samples:
+        if seconds <= 0:
+            continue
+        try:
+            output = io.BytesIO()
+            pydub.AudioSegment.from_wav(file_path).export(output, format="ogg", codec="libvorbis", parameters=["-q:a", "4"])
+        except Exception as e:
+            print(f"Could not encode sample {file_path}: {e}")
+            continue
+        encoded_bytes += len(output.getvalue())
+        channel_seconds += channels * seconds
+
+    if channel_seconds == 0:
+        print("No WAV sample could be encoded, using a nominal OGG bitrate.")
+        return FALLBACK_OGG_BYTES_PER_CHANNEL_SECOND
+    return encoded_bytes / channel_seconds
+
+
+def _forecast_duplicates(files):
+    """Predicted savings of removing duplicates, using size buckets and quick hashes only."""
+    by_size = {}
+    for file_path, file_size in files:
+        by_size.setdefault(file_size, []).append(file_path)
+
+    savings = []
+    for file_size, paths in by_size.items():
+        if len(paths) < 2 or file_size == 0:
+            continue
+        by_hash = {}
+        for file_path in paths:
+            try:
+                by_hash.setdefault(calculate_quick_hash(file_path), []).append(file_path)
+            except OSError as e:
+                print(f"Error hashing {file_path}: {e}")
+        for duplicates in by_hash.values():
+            for file_path in duplicates[1:]:
+                savings.append((file_path, file_size))
+    return savings
+
+
+def _forecast_game_files(folder, files, gamefolder):
+    """Predicted savings of removing files that are also in the game VPKs with the same size."""
+    vpk_files = get_vpk_files(gamefolder)
+    savings = []
+    for file_path, file_size in files:
+        rel_path = os.path.normpath(os.path.relpath(file_path, folder))
+        entry = vpk_files.get(rel_path)
+        if entry is not None and entry.length == file_size:
+            savings.append((file_path, file_size))
+    return savings
+
+
+def _collect_files(folder):
+    files = []
+    for root, dirs, filenames in os.walk(folder):
+        dirs[:] = [d for d in dirs if d != '.git']
+        for filename in filenames:
+            file_path = os.path.join(root, filename)
+            try:
+                files.append((file_path, os.path.getsize(file_path)))
+            except OSError:
+                pass
+    return files
+
+
+def build_forecast(folder, gamefolder=None, clamp_size=1024, png_size=512, audio_samples=5, progress_callback=None, files=None):
+    """
+    Estimate what each optimization would save without changing any files.
+
+    Args:
+        folder: Path to the content folder
+        gamefolder: Optional game folder, needed to forecast "Remove files already in game"
+        clamp_size: Clamp size used for the VTF clamp forecast
+        png_size: Clamp size used for the PNG clamp forecast
+        audio_samples: How many WAVs to actually encode to estimate the OGG bitrate
+        progress_callback: Optional callback(current, total) for progress updates
+        files: Optional list of (file_path, size) if the folder was already walked
+
+    Returns:
+        dict: operation name -> list of (file_path, predicted saved bytes)
+    """
+    if files is None:
+        files = _collect_files(folder)
+
+    table = {operation: [] for operation in OPERATIONS}
+    header_files = [(p, s) for p, s in files if p.lower().endswith((".vtf", ".png", ".wav"))]
+    total = len(header_files)
+
+    wav_plans = []
+    for idx, (file_path, file_size) in enumerate(header_files, 1):
+        lower = file_path.lower()
+        try:
+            if lower.endswith(".vtf"):
+                for operation, saved in _forecast_vtf(file_path, file_size, clamp_size).items():
+                    if saved > 0:
+                        table[operation].append((file_path, saved))
+            elif lower.endswith(".png"):
+                saved = _forecast_png(file_path, file_size, png_size)
+                if saved > 0:
+                    table["Clamp PNG file sizes"].append((file_path, saved))
+            elif lower.endswith(".wav"):
+                plan = _wav_plan(file_path)
+                if plan is not None:
+                    wav_plans.append((file_path, file_size) + plan)
+        except Exception as e:
+            print(f"✗ {file_path} - could not read header: {e}")
+
+        if progress_callback:
+            progress_callback(idx, total)
+
+    ogg_rate = _ogg_bytes_per_channel_second(wav_plans, audio_samples)
+    for file_path, file_size, channels, seconds in wav_plans:
+        saved = int(file_size - ogg_rate * channels * seconds)
+        if saved > 0:
+            table[".wav to .ogg"].append((file_path, saved))
+
+    table["Find duplicate files"] = _forecast_duplicates(files)
+    if gamefolder:
+        table["Remove files already in game"] = _forecast_game_files(folder, files, gamefolder)
+
+    return table
+
+
+def forecast_savings(folder, gamefolder=None, clamp_size=1024, png_size=512, top=25, progress_callback=None):
+    """Print a savings forecast per operation with the files that would save the most."""
+    start_time = time.time()
+    files = _collect_files(folder)
+    folder_size = sum(size for _, size in files)
+
+    table = build_forecast(folder, gamefolder, clamp_size, png_size, progress_callback=progress_callback, files=files)
+
+    print("="*60)
+    print("Predicted savings (nothing was changed):")
+    for operation in OPERATIONS:
+        if operation == "Remove files already in game" and not gamefolder:
+            continue
+        entries = sorted(table[operation], key=lambda entry: entry[1], reverse=True)
+        saved = sum(size for _, size in entries)
+        print(f"\n{operation}: {format_size(saved)} ({format_percentage(saved, folder_size)}) over {len(entries)} files")
+        for file_path, size in entries[:top]:
+            print(f"  {format_size(size):>10}  {os.path.relpath(file_path, folder)}")
+        if len(entries) > top:
+            print(f"  ... and {len(entries) - top} more files")
+    print("\nOperations overlap (eg clamp and DXT), so their savings don't add up.")
+    print("Time taken:", round(time.time() - start_time, 2), "seconds")
+    print("="*60)
+    return table
@@ -8,19 +8,24 @@ import signal
 from PySide6 import QtCore, QtGui, QtWidgets
 
 from utils.formatting import format_size, format_percentage
+from utils.parallel import default_worker_count
 from unused_files.modelformats import unused_model_formats
 from unused_files.content import unused_content
 from unused_files.remove_game_files import remove_game_files
 from unused_files.find_duplicates import find_duplicates
 from material_compression.resize_and_compress import resize_and_compress
-from material_compression.resize_png import clamp_pngs
+from material_compression.resize_png import clamp_pngs, optimize_pngs
 from material_compression.remove_mipmaps import remove_mipmaps
 from material_compression.resize_singlecolor import resize_single_color_images
+from material_compression.pipeline import material_pipeline, PIPELINE_STEPS
+from material_compression.resizelib import AUTO_CLAMP_DEFAULT_THRESHOLD
 from sound_compression.wav_to_mp3 import wav_to_mp3
 from sound_compression.wav_to_ogg import wav_to_ogg
 from sound_compression.mp3_to_ogg import mp3_to_ogg
 from sound_compression.trim_empty import trim_empty_audio
+from sound_compression.analysis import DEFAULT_MONO_SIMILARITY, DEFAULT_BANDWIDTH_DB
 from mapping.find_map_content import find_map_content
+from forecast.forecast_savings import forecast_savings
 
 
 class SignalStream(QtCore.QObject):
@@ -122,10 +127,17 @@ class MainWindow(QtWidgets.QMainWindow):
         self.size_label.setStyleSheet("QLabel { padding: 5px; }")
         size_row.addWidget(self.size_label)
         size_row.addStretch()
+        _cfg = self._load_config()
+        self.workers_spin = QtWidgets.QSpinBox()
+        self.workers_spin.setRange(1, os.cpu_count() or 1)
+        self.workers_spin.setValue(min(int(_cfg.get("workers", default_worker_count())), os.cpu_count() or 1))
+        self.workers_spin.setToolTip("Number of worker processes (or concurrent ffmpeg encoders for audio) used by operations that can work on multiple files at once.")
+        self.workers_spin.valueChanged.connect(lambda value: self._save_config({"workers": value}))
+        size_row.addWidget(QtWidgets.QLabel("Worker processes:"))
+        size_row.addWidget(self.workers_spin)
         main_layout.addLayout(size_row)
 
         # Restore last folder
-        _cfg = self._load_config()
         last_folder = _cfg.get("last_folder", "")
         if last_folder and os.path.exists(last_folder):
             self.folder_edit.setText(last_folder)
@@ -173,6 +185,12 @@ class MainWindow(QtWidgets.QMainWindow):
                    tooltip="Resave all VTF files to force the game to refresh cached textures.")
         add_button(textures_grid, 5, "Resize single-color VTFs", self.on_resize_single_color, recommended=True,
                    tooltip="Find and resize all single-color VTFs. Greatly reduces file size for solid color textures.")
+        add_button(textures_grid, 6, "VTF pipeline (single pass)", self.on_material_pipeline,
+                   tooltip="Run several VTF optimizations (single-color resize, clamp, DXT, mipmap removal) in one pass.\nEach VTF is only loaded and saved once, which is faster and avoids repeated DXT compression.")
+        add_button(textures_grid, 7, "Optimize PNGs (lossless)", self.on_optimize_png, recommended=True,
+                   tooltip="Losslessly recompress PNG images: strips metadata, uses the smallest color type and tries several compression settings.\nOptionally clamps them to a maximum size first.")
+        add_button(textures_grid, 8, "Auto clamp VTF file sizes", self.on_auto_clamp_vtf,
+                   tooltip="Pick the smallest size per VTF that still looks like the original (SSIM above the threshold).\nBlurry and low detail textures get much smaller, detailed ones keep their size up to the clamp size.\nAnimated, cubemap and volume VTFs are clamped to the maximum size instead.")
         textures_group.setLayout(textures_grid)
         actions_layout.addWidget(textures_group)
 
@@ -190,7 +208,9 @@ class MainWindow(QtWidgets.QMainWindow):
         add_button(cleanup_grid, 3, "Find and copy content used by .bsp", self.on_find_map_content,
                    tooltip="Extract all content referenced by a BSP map file and copy it to a new folder for easy map packing.")
         add_button(cleanup_grid, 4, "Find duplicate files (scan/remove)", self.on_find_duplicates, recommended=True,
-                   tooltip="Scan for duplicate files and optionally remove them. Keeps the first occurrence of each duplicate.")
+                   tooltip="Scan for duplicate files and optionally remove them. Keeps the first occurrence of each duplicate.\nTextures and sounds can be merged by rewriting the VMT and lua references to the kept copy,\ncopies that models or maps refer to are kept.")
+        add_button(cleanup_grid, 5, "Forecast savings (plan only)", self.on_forecast_savings, recommended=True,
+                   tooltip="Estimate how much each optimization would save without changing any files.\nUses file headers and a few sample encodes, so it's fast even on large addons.")
         cleanup_group.setLayout(cleanup_grid)
         actions_layout.addWidget(cleanup_group)
 
@@ -200,11 +220,11 @@ class MainWindow(QtWidgets.QMainWindow):
         audio_grid.setHorizontalSpacing(12)
         audio_grid.setVerticalSpacing(8)
         add_button(audio_grid, 0, ".wav to .ogg (skips looped/cued)", self.on_wav_to_ogg,
-                   tooltip="Convert WAV audio files to OGG format for better compression. Skips files with loop points or cue points.")
+                   tooltip="Convert WAV audio files to OGG format for better compression. Skips files with loop points or cue points.\nCan downmix identical stereo channels and lower the sample rate of band-limited files.")
         add_button(audio_grid, 1, ".wav to .mp3 (skips looped/cued)", self.on_wav_to_mp3,
-                   tooltip="Convert WAV audio files to MP3 format. Skips files with loop points or cue points.")
+                   tooltip="Convert WAV audio files to MP3 format. Skips files with loop points or cue points.\nCan downmix identical stereo channels and lower the sample rate of band-limited files.")
         add_button(audio_grid, 2, ".mp3 to .ogg", self.on_mp3_to_ogg,
-                   tooltip="Convert MP3 audio files to OGG format. OGG is generally better for Garry's Mod.")
+                   tooltip="Convert MP3 audio files to OGG format. OGG is generally better for Garry's Mod.\nCan downmix identical stereo channels and lower the sample rate of band-limited files.")
         add_button(audio_grid, 3, "Trim empty audio tail", self.on_trim_empty_audio,
                    tooltip="Remove silent/empty audio at the end of sound files to reduce file size.")
         audio_group.setLayout(audio_grid)
@@ -285,10 +305,106 @@ class MainWindow(QtWidgets.QMainWindow):
             self._save_config({"last_folder": folder})
             self.calculate_initial_folder_size(folder)
 
+    def worker_count(self) -> int:
+        return self.workers_spin.value()
+
     def ask_int(self, title: str, label: str, default: int = 1024) -> int | None:
         value, ok = QtWidgets.QInputDialog.getInt(self, title, label, value=default, minValue=1, maxValue=10_000_000, step=1)
         return value if ok else None
 
+    def ask_float(self, title: str, label: str, default: float, min_value: float, max_value: float, decimals: int = 3) -> float | None:
+        value, ok = QtWidgets.QInputDialog.getDouble(self, title, label, value=default, minValue=min_value, maxValue=max_value, decimals=decimals)
+        return value if ok else None
+
+    def ask_pipeline_steps(self, default_size: int = 1024) -> tuple[list[str], int] | None:
+        """Ask which pipeline steps to run (checkable, drag to reorder) and the clamp size."""
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle("VTF pipeline")
+        layout = QtWidgets.QVBoxLayout(dialog)
+        layout.addWidget(QtWidgets.QLabel("Steps to run, drag to change the order.\nDXT always runs after resizing so textures are only encoded once."))
+
+        steps_list = QtWidgets.QListWidget()
+        steps_list.setDragDropMode(QtWidgets.QAbstractItemView.InternalMove)
+        for step, description in PIPELINE_STEPS.items():
+            item = QtWidgets.QListWidgetItem(description)
+            item.setData(QtCore.Qt.UserRole, step)
+            item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+            item.setCheckState(QtCore.Qt.Checked if step != "mips" else QtCore.Qt.Unchecked)
+            steps_list.addItem(item)
+        layout.addWidget(steps_list)
+
+        size_row = QtWidgets.QHBoxLayout()
+        size_spin = QtWidgets.QSpinBox()
+        size_spin.setRange(1, 10_000_000)
+        size_spin.setValue(default_size)
+        size_row.addWidget(QtWidgets.QLabel("Clamp size (pixels):"))
+        size_row.addWidget(size_spin)
+        layout.addLayout(size_row)
+
+        buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+
+        if dialog.exec() != QtWidgets.QDialog.Accepted:
+            return None
+
+        steps = []
+        for row in range(steps_list.count()):
+            item = steps_list.item(row)
+            if item.checkState() == QtCore.Qt.Checked:
+                steps.append(item.data(QtCore.Qt.UserRole))
+        return steps, size_spin.value()
+
+    def ask_audio_analysis(self, title: str) -> dict | None:
+        """Ask whether to downmix/resample before encoding and with which thresholds, remembered in the config."""
+        cfg = self._load_config()
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle(title)
+        layout = QtWidgets.QVBoxLayout(dialog)
+
+        analyze_check = QtWidgets.QCheckBox("Downmix identical stereo channels and lower the sample rate of band-limited files")
+        analyze_check.setChecked(bool(cfg.get("audio_analyze", False)))
+        layout.addWidget(analyze_check)
+
+        form = QtWidgets.QFormLayout()
+        similarity_spin = QtWidgets.QDoubleSpinBox()
+        similarity_spin.setDecimals(5)
+        similarity_spin.setRange(0.9, 1.0)
+        similarity_spin.setSingleStep(0.0001)
+        similarity_spin.setValue(float(cfg.get("audio_mono_similarity", DEFAULT_MONO_SIMILARITY)))
+        form.addRow("Minimum channel similarity for mono:", similarity_spin)
+        bandwidth_spin = QtWidgets.QDoubleSpinBox()
+        bandwidth_spin.setRange(-140.0, -20.0)
+        bandwidth_spin.setSuffix(" dB")
+        bandwidth_spin.setValue(float(cfg.get("audio_bandwidth_db", DEFAULT_BANDWIDTH_DB)))
+        form.addRow("Content level below the loudest frequency:", bandwidth_spin)
+        layout.addLayout(form)
+        analyze_check.toggled.connect(similarity_spin.setEnabled)
+        analyze_check.toggled.connect(bandwidth_spin.setEnabled)
+        similarity_spin.setEnabled(analyze_check.isChecked())
+        bandwidth_spin.setEnabled(analyze_check.isChecked())
+
+        buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+
+        if dialog.exec() != QtWidgets.QDialog.Accepted:
+            return None
+
+        options = {
+            "analyze": analyze_check.isChecked(),
+            "mono_similarity": similarity_spin.value(),
+            "bandwidth_db": bandwidth_spin.value(),
+        }
+        self._save_config({
+            "audio_analyze": options["analyze"],
+            "audio_mono_similarity": options["mono_similarity"],
+            "audio_bandwidth_db": options["bandwidth_db"],
+        })
+        return options
+
     def ask_yes_no(self, title: str, text: str) -> bool:
         res = QtWidgets.QMessageBox.question(self, title, text, QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
         return res == QtWidgets.QMessageBox.Yes
@@ -442,8 +558,10 @@ class MainWindow(QtWidgets.QMainWindow):
             return
         remove = self.ask_yes_no("Remove files?", "Do you want to remove the found unused files? This isn't 100% and can remove used files!")
 
+        workers = self.worker_count()
+
         def task():
-            size, count = unused_content(folder, remove)
+            size, count = unused_content(folder, remove, workers=workers)
             print((f"Removed {count} unused files, saving {format_size(size)}") if remove else (f"Found {count} unused files, taking up {format_size(size)}"))
             return size, count
 
@@ -470,19 +588,43 @@ class MainWindow(QtWidgets.QMainWindow):
         if size is None:
             return
         
+        workers = self.worker_count()
+
         def task():
-            return resize_and_compress(folder, int(size), progress_callback=self.worker.progress.emit)
+            return resize_and_compress(folder, int(size), progress_callback=self.worker.progress.emit, workers=workers)
         
         self.start_task("Clamp VTF file sizes", task, determinate=True)
 
+    def on_auto_clamp_vtf(self):
+        folder = self.ensure_folder()
+        if not folder:
+            return
+        size = self.ask_int("Auto clamp VTF size", "Maximum size (pixels)", default=1024)
+        if size is None:
+            return
+        threshold = self.ask_float("Auto clamp VTF size", "Minimum similarity to the original (SSIM, 0-1)",
+                                   default=AUTO_CLAMP_DEFAULT_THRESHOLD, min_value=0.5, max_value=1.0)
+        if threshold is None:
+            return
+
+        workers = self.worker_count()
+
+        def task():
+            return resize_and_compress(folder, int(size), progress_callback=self.worker.progress.emit, workers=workers,
+                                       quality_threshold=threshold)
+
+        self.start_task("Auto clamp VTF file sizes", task, determinate=True)
+
     def on_use_dxt(self):
         folder = self.ensure_folder()
         if not folder:
             return
         # Use a very large clamp to force DXT path
         
+        workers = self.worker_count()
+
         def task():
-            return resize_and_compress(folder, 1_000_000, progress_callback=self.worker.progress.emit)
+            return resize_and_compress(folder, 1_000_000, progress_callback=self.worker.progress.emit, workers=workers)
         
         self.start_task("Use DXT for VTFs", task, determinate=True)
 
@@ -491,8 +633,10 @@ class MainWindow(QtWidgets.QMainWindow):
         if not folder:
             return
         
+        workers = self.worker_count()
+
         def task():
-            return remove_mipmaps(folder, progress_callback=self.worker.progress.emit)
+            return remove_mipmaps(folder, progress_callback=self.worker.progress.emit, workers=workers)
         
         self.start_task("Remove mipmaps", task, determinate=True)
 
@@ -509,13 +653,35 @@ class MainWindow(QtWidgets.QMainWindow):
         
         self.start_task("Clamp PNG file sizes", task, determinate=True)
 
+    def on_optimize_png(self):
+        folder = self.ensure_folder()
+        if not folder:
+            return
+        size = None
+        if self.ask_yes_no("Clamp PNGs?", "Also resize PNGs larger than a maximum size?"):
+            size = self.ask_int("Clamp PNG size", "Clamp size (pixels)", default=512)
+            if size is None:
+                return
+
+        workers = self.worker_count()
+
+        def task():
+            return optimize_pngs(folder, size, progress_callback=self.worker.progress.emit, workers=workers)
+
+        self.start_task("Optimize PNG files", task, determinate=True)
+
     def on_wav_to_mp3(self):
         folder = self.ensure_folder()
         if not folder:
             return
         
+        options = self.ask_audio_analysis(".wav to .mp3")
+        if options is None:
+            return
+        workers = self.worker_count()
+
         def task():
-            return wav_to_mp3(folder, progress_callback=self.worker.progress.emit)
+            return wav_to_mp3(folder, progress_callback=self.worker.progress.emit, workers=workers, **options)
         
         self.start_task(".wav to .mp3", task, determinate=True)
 
@@ -524,8 +690,13 @@ class MainWindow(QtWidgets.QMainWindow):
         if not folder:
             return
         
+        options = self.ask_audio_analysis(".wav to .ogg")
+        if options is None:
+            return
+        workers = self.worker_count()
+
         def task():
-            return wav_to_ogg(folder, progress_callback=self.worker.progress.emit)
+            return wav_to_ogg(folder, progress_callback=self.worker.progress.emit, workers=workers, **options)
         
         self.start_task(".wav to .ogg", task, determinate=True)
 
@@ -533,7 +704,16 @@ class MainWindow(QtWidgets.QMainWindow):
         folder = self.ensure_folder()
         if not folder:
             return
-        self.start_task(".mp3 to .ogg", mp3_to_ogg, folder)
+
+        options = self.ask_audio_analysis(".mp3 to .ogg")
+        if options is None:
+            return
+        workers = self.worker_count()
+
+        def task():
+            return mp3_to_ogg(folder, progress_callback=self.worker.progress.emit, workers=workers, **options)
+
+        self.start_task(".mp3 to .ogg", task, determinate=True)
 
     def on_trim_empty_audio(self):
         folder = self.ensure_folder()
@@ -595,19 +775,62 @@ class MainWindow(QtWidgets.QMainWindow):
         if not folder:
             return
         
+        workers = self.worker_count()
+
         def task():
-            return resize_single_color_images(folder, progress_callback=self.worker.progress.emit)
+            return resize_single_color_images(folder, progress_callback=self.worker.progress.emit, workers=workers)
         
         self.start_task("Resize single-color images", task, determinate=True)
 
+    def on_material_pipeline(self):
+        folder = self.ensure_folder()
+        if not folder:
+            return
+        result = self.ask_pipeline_steps()
+        if result is None:
+            return
+        steps, size = result
+        if not steps:
+            QtWidgets.QMessageBox.warning(self, "No steps", "Please select at least one step.")
+            return
+
+        workers = self.worker_count()
+
+        def task():
+            return material_pipeline(folder, steps, size, progress_callback=self.worker.progress.emit, workers=workers)
+
+        self.start_task("VTF pipeline", task, determinate=True)
+
+    def on_forecast_savings(self):
+        folder = self.ensure_folder()
+        if not folder:
+            return
+        clamp_size = self.ask_int("Clamp VTF size", "Clamp size used for the VTF forecast (pixels)", default=1024)
+        if clamp_size is None:
+            return
+        gamefolder = None
+        if self.ask_yes_no("Include game files?", "Also forecast removing files already in the game? This requires the game folder."):
+            gamefolder = self.ask_directory("Absolute path to game folder (eg C:/Program Files (x86)/Steam/steamapps/common/GarrysMod)")
+            if not gamefolder or not os.path.exists(os.path.join(gamefolder, "gmod.exe")):
+                QtWidgets.QMessageBox.warning(self, "Invalid game folder", "The selected folder doesn't contain gmod.exe")
+                return
+
+        def task():
+            return forecast_savings(folder, gamefolder, clamp_size=int(clamp_size), progress_callback=self.worker.progress.emit)
+
+        self.start_task("Forecast savings", task, determinate=True)
+
     def on_find_duplicates(self):
         folder = self.ensure_folder()
         if not folder:
             return
         remove = self.ask_yes_no("Remove duplicates?", "Do you want to remove the found duplicate files? The first occurrence of each duplicate will be kept.")
+        dedupe = remove and self.ask_yes_no("Rewrite references?", "Point VMT and lua/txt/json references at the kept copy before removing the others? Only textures and sounds are removed then, and only copies no model, map, particle or scene refers to. Lua that builds paths from pieces isn't rewritten, check it before shipping.")
+
+        workers = self.worker_count()
 
         def task():
-            return find_duplicates(folder, remove, progress_callback=self.worker.progress.emit)
+            return find_duplicates(folder, remove, progress_callback=self.worker.progress.emit, workers=workers, dedupe=dedupe)
 
         self.start_task("Find duplicate files", task, determinate=True)
 
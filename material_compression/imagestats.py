@@ -0,0 +1,172 @@
+from typing import NamedTuple
+import numpy as np
+
+# Pixels per chunk, keeps the temporary arrays small and lets the scan stop early
+CHUNK_PIXELS = 1 << 16
+# Pixels analyze_rgba_images joins into one batch before analyzing it
+BATCH_PIXELS = 1 << 20
+
+
+class PixelStats(NamedTuple):
+    alpha_min: int
+    alpha_max: int
+    translucent: bool
+    binary_alpha: bool
+    single_color: bool
+
+
+def rgba_view(data) -> np.ndarray:
+    """View RGBA8888 bytes as a (pixels, 4) uint8 array without copying them."""
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 4)
+
+
+def is_uniform_opaque(data, sample_step: int = 1021) -> bool:
+    """
+    Check if RGBA8888 pixel data is fully opaque and only contains one color.
+
+    A sparse sample of every sample_step-th pixel is checked first, then all pixels
+    chunk by chunk. Returns as soon as a differing pixel is found.
+    """
+    pixels = rgba_view(data)
+    if len(pixels) == 0 or pixels[0, 3] != 255:
+        return False
+
+    packed = pixels.view(np.uint32).reshape(-1)
+    first = packed[0]
+    if not np.all(packed[::sample_step] == first):
+        return False
+
+    for start in range(0, len(packed), CHUNK_PIXELS):
+        if not np.all(packed[start:start + CHUNK_PIXELS] == first):
+            return False
+    return True
+
+
+def analyze_rgba(data, early_exit: bool = True) -> PixelStats:
+    """
+    Analyze RGBA8888 pixel data in a single chunked pass.
+
+    Args:
+        data: RGBA8888 bytes, eg from VTF.get_image_data_as_rgba8888
+        early_exit: Stop once translucent, binary_alpha and single_color can't change anymore.
+            alpha_min/alpha_max then only cover the scanned pixels.
+
+    Returns:
+        PixelStats with the alpha extrema, if any pixel has alpha below 255, if alpha
+        only uses 0 and 255 and if every pixel has the exact same RGBA value.
+    """
+    pixels = rgba_view(data)
+    if len(pixels) == 0:
+        return PixelStats(255, 255, False, True, True)
+
+    # Whole pixels as a single integer so uniformity is one comparison per pixel
+    packed = pixels.view(np.uint32).reshape(-1)
+    first = packed[0]
+
+    alpha_min = 255
+    alpha_max = 0
+    binary_alpha = True
+    single_color = True
+
+    for start in range(0, len(pixels), CHUNK_PIXELS):
+        alpha = pixels[start:start + CHUNK_PIXELS, 3]
+        alpha_min = min(alpha_min, int(alpha.min()))
+        alpha_max = max(alpha_max, int(alpha.max()))
+        if binary_alpha and alpha_min < 255:
+            binary_alpha = not np.any((alpha != 0) & (alpha != 255))
+        if single_color:
+            single_color = bool(np.all(packed[start:start + CHUNK_PIXELS] == first))
+
+        if early_exit and alpha_min < 255 and not binary_alpha and not single_color:
+            break
+
+    return PixelStats(alpha_min, alpha_max, alpha_min < 255, binary_alpha, single_color)
+
+
+def analyze_rgba_images(images, early_exit: bool = True) -> PixelStats:
+    """
+    Analyze several RGBA8888 images (frames, faces, slices) as if they were one.
+
+    Small images are joined into batches of about BATCH_PIXELS so animated textures
+    with many tiny frames don't pay the per-call overhead for each frame. images can be
+    a generator, nothing after the early exit point is consumed.
+    """
+    alpha_min = 255
+    alpha_max = 0
+    binary_alpha = True
+    single_color = True
+    first = None
+    scanned = False
+
+    def merge(batch):
+        nonlocal alpha_min, alpha_max, binary_alpha, single_color, first, scanned
+        data = b"".join(batch)
+        if len(data) == 0:
+            return
+        stats = analyze_rgba(data, early_exit)
+        alpha_min = min(alpha_min, stats.alpha_min)
+        alpha_max = max(alpha_max, stats.alpha_max)
+        binary_alpha = binary_alpha and stats.binary_alpha
+        if first is None:
+            first = data[:4]
+        single_color = single_color and stats.single_color and data[:4] == first
+        scanned = True
+
+    batch = []
+    batch_size = 0
+    for data in images:
+        batch.append(data)
+        batch_size += len(data)
+        if batch_size >= BATCH_PIXELS * 4:
+            merge(batch)
+            batch = []
+            batch_size = 0
+            if early_exit and alpha_min < 255 and not binary_alpha and not single_color:
+                break
+    else:
+        merge(batch)
+
+    if not scanned:
+        return PixelStats(255, 255, False, True, True)
+    return PixelStats(alpha_min, alpha_max, alpha_min < 255, binary_alpha, single_color)
+
+
+def luminance(data, width: int, height: int) -> np.ndarray:
+    """Rec. 601 luma of RGBA8888 bytes as a (height, width) float32 array."""
+    pixels = rgba_view(data).reshape(height, width, 4).astype(np.float32)
+    return pixels[..., 0] * 0.299 + pixels[..., 1] * 0.587 + pixels[..., 2] * 0.114
+
+
+def alpha_channel(data, width: int, height: int) -> np.ndarray:
+    """Alpha of RGBA8888 bytes as a (height, width) float32 array."""
+    return rgba_view(data)[:, 3].reshape(height, width).astype(np.float32)
+
+
+def ssim(a: np.ndarray, b: np.ndarray, block: int = 8) -> float:
+    """
+    Mean structural similarity of two equally sized 0-255 grayscale images.
+
+    Uses non-overlapping block x block windows instead of a gaussian window so the
+    whole computation is a couple of reshapes and means. Rows and columns that don't
+    fill a whole block are ignored, images smaller than a block are compared as one window.
+    """
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+
+    h, w = a.shape
+    bh = min(block, h)
+    bw = min(block, w)
+    h -= h % bh
+    w -= w % bw
+    shape = (h // bh, bh, w // bw, bw)
+    a = a[:h, :w].reshape(shape)
+    b = b[:h, :w].reshape(shape)
+
+    mean_a = a.mean(axis=(1, 3))
+    mean_b = b.mean(axis=(1, 3))
+    var_a = a.var(axis=(1, 3))
+    var_b = b.var(axis=(1, 3))
+    cov = (a * b).mean(axis=(1, 3)) - mean_a * mean_b
+
+    ssim_map = ((2 * mean_a * mean_b + c1) * (2 * cov + c2)) / ((mean_a ** 2 + mean_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
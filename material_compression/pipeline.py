@@ -0,0 +1,158 @@
+import os
+import time
+from sourcepp import vtfpp
+from material_compression.resizelib import analyzeVTF, clampVTFSize, setBestFormat, resizeSingleColorVTF, removeVTFMipmaps, SINGLE_COLOR_SIZE
+from material_compression.vtfheader import VTFHeader, scan_vtf_headers, fits_clamp, is_opaque_dxt1
+from utils.formatting import format_size, format_percentage
+from utils.parallel import run_parallel
+
+# Step id -> description, in the recommended order
+PIPELINE_STEPS = {
+    "single_color": "Resize single-color VTFs",
+    "clamp": "Clamp VTF file sizes",
+    "format": "Use DXT for VTFs",
+    "mips": "Remove mipmaps",
+}
+# Steps that resize the image, a DXT VTF resized after the format step would be encoded twice
+RESIZE_STEPS = ("single_color", "clamp")
+
+
+def is_noop(header: VTFHeader, steps, max_size) -> bool:
+    """True if the header alone shows that none of the steps would change the VTF."""
+    for step in steps:
+        if step == "single_color" and not (header.width == SINGLE_COLOR_SIZE and header.height == SINGLE_COLOR_SIZE):
+            return False
+        if step == "clamp" and not fits_clamp(header, max_size):
+            return False
+        if step == "format" and not is_opaque_dxt1(header):
+            return False
+        if step == "mips" and header.mip_count > 1:
+            return False
+    return True
+
+
+def order_steps(steps) -> list[str]:
+    """Copy of steps with "format" moved right after the last resize step if it came before it, so DXT is only encoded once."""
+    steps = list(steps)
+    if "format" not in steps:
+        return steps
+    last_resize = max((index for index, step in enumerate(steps) if step in RESIZE_STEPS), default=-1)
+    if steps.index("format") < last_resize:
+        steps.remove("format")
+        steps.insert(last_resize, "format")
+    return steps
+
+
+def process_vtf(file_path, steps, max_size):
+    """
+    Apply the pipeline steps to a single VTF with one load and at most one bake.
+
+    Returns:
+        tuple: (old_size, new_size, applied steps)
+    """
+    old_size = os.path.getsize(file_path)
+
+    try:
+        vtf = vtfpp.VTF(file_path)
+    except Exception as e:
+        print(f"✗ {file_path} - failed to load VTF: {e}")
+        return old_size, old_size, []
+    if not vtf:
+        # An empty VTF would analyze as single-color and get baked over the original
+        print(f"✗ {file_path} - failed to load VTF: not a valid VTF")
+        return old_size, old_size, []
+    try:
+        stats = analyzeVTF(vtf)
+    except Exception as e:
+        print(f"✗ {file_path} - failed to load VTF: {e}")
+        return old_size, old_size, []
+
+    applied = []
+    for step in steps:
+        if step == "single_color":
+            changed = stats.single_color and not stats.translucent and resizeSingleColorVTF(vtf)
+        elif step == "clamp":
+            changed = clampVTFSize(vtf, file_path, max_size)
+        elif step == "format":
+            changed = setBestFormat(vtf, stats)
+        elif step == "mips":
+            changed = removeVTFMipmaps(vtf)
+        else:
+            raise ValueError(f"Unknown pipeline step: {step}")
+
+        if changed:
+            applied.append(step)
+
+    if not applied:
+        return old_size, old_size, []
+
+    vtf.bake_to_file(file_path)
+    new_size = os.path.getsize(file_path)
+    print(f"✓ {file_path} - {', '.join(applied)} (saved {format_size(old_size - new_size)})")
+    return old_size, new_size, applied
+
+
+def material_pipeline(folder, steps, max_size=1024, progress_callback=None, workers=1):
+    """
+    Run several VTF optimizations in a single decode/encode pass per file.
+
+    Args:
+        folder: Path to the folder containing VTF files
+        steps: Ordered list of step ids from PIPELINE_STEPS, "format" always runs after the resize steps
+        max_size: Clamp size used by the "clamp" step
+        progress_callback: Optional callback(current, total) for progress updates
+        workers: Number of worker processes to spread the files over
+    """
+    old_size = 0
+    new_size = 0
+    modified_count = 0
+    step_counts = {step: 0 for step in steps}
+    start_time = time.time()
+
+    for step in steps:
+        if step not in PIPELINE_STEPS:
+            raise ValueError(f"Unknown pipeline step: {step}")
+    steps = order_steps(steps)
+
+    print("Running material pipeline:", " -> ".join(PIPELINE_STEPS[step] for step in steps))
+
+    vtf_files = []
+    for path, subdirs, files in os.walk(folder):
+        for name in files:
+            if name.endswith(".vtf"):
+                vtf_files.append(os.path.join(path, name))
+
+    headers = scan_vtf_headers(vtf_files)
+    todo_files = []
+    for file_path in vtf_files:
+        header = headers.get(file_path)
+        if header is not None and is_noop(header, steps, max_size):
+            file_size = os.path.getsize(file_path)
+            old_size += file_size
+            new_size += file_size
+        else:
+            todo_files.append(file_path)
+    print(f"Skipping {len(vtf_files) - len(todo_files)} VTF files that need no changes")
+
+    items = [(file_path, steps, max_size) for file_path in todo_files]
+    for old_file_size, new_file_size, applied in run_parallel(process_vtf, items, workers, progress_callback):
+        old_size += old_file_size
+        new_size += new_file_size
+        if applied:
+            modified_count += 1
+        for step in applied:
+            step_counts[step] += 1
+
+    print("="*60)
+    print(f"Files processed: {len(vtf_files)}")
+    print(f"Files modified: {modified_count}")
+    for step in steps:
+        print(f"  {PIPELINE_STEPS[step]}: {step_counts[step]}")
+    if modified_count > 0:
+        print("Reduced size by ", format_percentage(old_size - new_size, old_size))
+        print("Reduced size by ", format_size(old_size - new_size))
+    else:
+        print("No files were modified.")
+    print("Time taken:", round(time.time() - start_time, 2), "seconds")
+    print("="*60)
+    return old_size - new_size, modified_count
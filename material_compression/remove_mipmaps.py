@@ -1,14 +1,35 @@
 import os
 import time
 from sourcepp import vtfpp
+from material_compression.resizelib import removeVTFMipmaps
+from material_compression.vtfheader import scan_vtf_headers
 from utils.formatting import format_size, format_percentage
+from utils.parallel import run_parallel
 
-def remove_mipmaps(folder, progress_callback=None):
+def remove_file_mipmaps(file_path):
+    """Remove the mipmaps of a single VTF, returns (old_size, new_size, modified)."""
+    old_file_size = os.path.getsize(file_path)
+
+    vtf = vtfpp.VTF(file_path)
+    old_mipcount = vtf.mip_count
+    if not removeVTFMipmaps(vtf):
+        return old_file_size, old_file_size, False
+
+    vtf.bake_to_file(file_path)
+
+    new_file_size = os.path.getsize(file_path)
+    saved_bytes = old_file_size - new_file_size
+    saved_mb = saved_bytes / (1024 * 1024)
+    print(f"✓ {file_path} - {old_mipcount} -> 0 (saved {saved_mb:.2f} MB)")
+    return old_file_size, new_file_size, True
+
+def remove_mipmaps(folder, progress_callback=None, workers=1):
     """Remove mipmaps from all VTF files in the specified folder
     
     Args:
         folder: Path to the folder containing VTF files
         progress_callback: Optional callback(current, total) for progress updates
+        workers: Number of worker processes to spread the files over
     """
     old_size = 0
     new_size = 0
@@ -29,32 +50,28 @@ def remove_mipmaps(folder, progress_callback=None):
     print(f"Found {total_files} VTF files")
     print("Removing mipmaps from VTF files...")
     
-    for idx, file_path in enumerate(vtf_files, 1):
-        # Update progress
-        if progress_callback:
-            progress_callback(idx, total_files)
-        
-        old_file_size = os.path.getsize(file_path)
-        old_size += old_file_size
-        
-        vtf = vtfpp.VTF(file_path)
-        old_mipcount = vtf.mip_count
-        if old_mipcount <= 1:
-            new_size += old_file_size
+    # VTFs without mipmaps don't need to be loaded at all
+    headers = scan_vtf_headers(vtf_files)
+    todo_files = []
+    for file_path in vtf_files:
+        header = headers.get(file_path)
+        if header is not None and header.mip_count <= 1:
+            file_size = os.path.getsize(file_path)
+            old_size += file_size
+            new_size += file_size
             processed_count += 1
-            continue
-        
-        vtf.mip_count = 0
-        vtf.bake_to_file(file_path)
-        
-        success_count += 1
-        new_file_size = os.path.getsize(file_path)
+        else:
+            todo_files.append(file_path)
+    if processed_count > 0:
+        print(f"Skipping {processed_count} VTF files without mipmaps")
+
+    items = [(file_path,) for file_path in todo_files]
+    for old_file_size, new_file_size, modified in run_parallel(remove_file_mipmaps, items, workers, progress_callback):
+        old_size += old_file_size
         new_size += new_file_size
-        saved_bytes = old_file_size - new_file_size
-        saved_mb = saved_bytes / (1024 * 1024)
-        print(f"✓ {file_path} - {old_mipcount} -> 0 (saved {saved_mb:.2f} MB)")
-        
         processed_count += 1
+        if modified:
+            success_count += 1
     
     print("="*60)
     print(f"Files processed: {processed_count}")
@@ -1,48 +1,121 @@
 import os
 import time
-from material_compression.resizelib import cleanupVTF
+from material_compression.resizelib import cleanupVTF, AUTO_CLAMP_MIN_SIZE
 from utils.formatting import format_size, format_percentage
+from material_compression.vtfheader import scan_vtf_headers, fits_clamp, is_opaque_dxt1
+from material_compression.vtfcache import operation_key, is_optimized, mark_optimized
+from utils.cache import file_digest
+from utils.journal import OperationJournal
+from utils.parallel import run_parallel
 
-def resize_and_compress(folder, size, progress_callback=None):
+def cleanup_file(file_path, size, operation=None, quality_threshold=None):
+    """
+    Clean up a single VTF, returns (file_path, old_size, new_size, converted, digest, cached).
+
+    If operation is given, files whose content hash is already cached for it are
+    skipped without loading them (cached is True) and digest is the hash of the resulting
+    file, None if the file couldn't be processed.
+    quality_threshold enables the automatic clamp size, see findAutoClampSize.
+    """
+    old_size = os.path.getsize(file_path)
+    if operation is None:
+        converted = bool(cleanupVTF(file_path, size, quality_threshold))
+        new_size = os.path.getsize(file_path) if converted else old_size
+        return file_path, old_size, new_size, converted, None, False
+
+    digest = file_digest(file_path)
+    if is_optimized(digest, operation):
+        return file_path, old_size, old_size, False, None, True
+
+    converted = cleanupVTF(file_path, size, quality_threshold)
+    if converted is None:
+        # Unreadable files are tried again on the next run instead of being remembered as optimized
+        return file_path, old_size, old_size, False, None, False
+    if converted:
+        return file_path, old_size, os.path.getsize(file_path), True, file_digest(file_path), False
+    return file_path, old_size, old_size, False, digest, False
+
+def resize_and_compress(folder, size, progress_callback=None, workers=1, use_cache=True, resume=True, quality_threshold=None):
     old_size = 0
     new_size = 0
     replace_count = 0
     start_time = time.time()
 
-    # First pass: count total files
-    total_files = 0
-    if progress_callback:
-        for path, subdirs, files in os.walk(folder):
-            for name in files:
-                if name.endswith(".vtf"):
-                    total_files += 1
-        processed = 0
+    # Files finished by an earlier run that got interrupted
+    journal = OperationJournal(folder, f"resize_and_compress:{size}:{quality_threshold}", resume)
+    resumed_count = 0
 
+    vtf_files = []
     for path, subdirs, files in os.walk(folder):
         for name in files:
-            if not name.endswith(".vtf"):
-                continue
+            if name.endswith(".vtf"):
+                vtf_files.append(os.path.join(path, name))
+
+    # Already DXT1 and within the clamp, cleanupVTF wouldn't change these.
+    # The automatic clamp size can go down to AUTO_CLAMP_MIN_SIZE.
+    clamp_limit = size if quality_threshold is None else min(size, AUTO_CLAMP_MIN_SIZE)
+    headers = scan_vtf_headers(vtf_files)
+    skipped_count = 0
+    todo_files = []
+    for file_path in vtf_files:
+        entry = journal.get(file_path)
+        if entry is not None:
+            old_size += entry["old_size"]
+            new_size += entry["new_size"]
+            replace_count += entry["converted"]
+            resumed_count += 1
+            continue
+
+        header = headers.get(file_path)
+        if header is not None and is_opaque_dxt1(header) and fits_clamp(header, clamp_limit):
+            file_size = os.path.getsize(file_path)
+            old_size += file_size
+            new_size += file_size
+            skipped_count += 1
+        else:
+            todo_files.append(file_path)
+
+    operation = None
+    if use_cache and quality_threshold is None:
+        operation = operation_key("cleanupVTF", max_size=size)
+    elif use_cache:
+        operation = operation_key("cleanupVTF", max_size=size, quality_threshold=quality_threshold)
+    optimized_digests = []
+    cached_count = 0
+
+    if resumed_count > 0:
+        print("Resuming, skipping", resumed_count, "files finished by the previous run.")
 
-            old_size_temp = os.path.getsize(os.path.join(path, name))
-            converted = cleanupVTF(os.path.join(path, name), size)
+    items = [(file_path, size, operation, quality_threshold) for file_path in todo_files]
+    try:
+        for file_path, old_size_temp, new_size_temp, converted, digest, cached in run_parallel(cleanup_file, items, workers, progress_callback):
+            journal.record(file_path, old_size=old_size_temp, new_size=new_size_temp, converted=converted)
+            old_size += old_size_temp
+            new_size += new_size_temp
             if converted:
                 replace_count += 1
-                new_size += os.path.getsize(os.path.join(path, name))
-                old_size += old_size_temp
-            else:
-                new_size += old_size_temp
-                old_size += old_size_temp
-            
-            if progress_callback:
-                processed += 1
-                progress_callback(processed, total_files)
+            if digest is not None:
+                optimized_digests.append(digest)
+            cached_count += cached
+    finally:
+        journal.close()
+        if operation is not None:
+            mark_optimized(optimized_digests, operation)
+    journal.finish()
 
     print("="*60)
     print("Replaced", replace_count, "files.")
+    if skipped_count > 0:
+        print("Skipped", skipped_count, "files that are already DXT1 within the clamp size.")
+    if cached_count > 0:
+        print("Skipped", cached_count, "files that were already optimized.")
     if replace_count == 0:
         print("No files were replaced.")
     else:
-        print("Clamped to", size, "resolution.")
+        if quality_threshold is None:
+            print("Clamped to", size, "resolution.")
+        else:
+            print("Clamped to at most", size, "resolution with a minimum SSIM of", quality_threshold)
         print("Reduced size by ", format_percentage(old_size - new_size, old_size))
         print("Reduced size by ", format_size(old_size - new_size))
     print("Time taken:", round(time.time() - start_time, 2), "seconds")
@@ -1,5 +1,9 @@
+import io
 import os
+import numpy as np
 from PIL import Image
+from utils.formatting import format_size, format_percentage
+from utils.parallel import run_parallel
 
 def clamp_pngs(folder, max_size, progress_callback=None):
     total_size = 0
@@ -49,3 +53,156 @@ def clamp_pngs(folder, max_size, progress_callback=None):
     print(f"Resized {total_resized_files} files, {total_saved_mb} mb saved")
     print("="*60)
     return total_size - total_resized, total_resized_files
+
+
+# zlib strategies tried for every candidate: default, filtered and RLE
+PNG_COMPRESS_TYPES = (0, 1, 3)
+PNG_COMPRESS_LEVELS = (6, 9)
+# Sources this many times larger than the target get reduced by an integer factor before LANCZOS
+PNG_REDUCING_GAP = 3.0
+
+
+def _png_bit_depth(filepath):
+    with open(filepath, "rb") as f:
+        header = f.read(26)
+    if len(header) < 26 or header[:8] != b"\x89PNG\r\n\x1a\n":
+        return None
+    return header[24]
+
+
+def _palette_image(pixels, opaque):
+    """Build a lossless palette image if the RGBA pixels use at most 256 colors."""
+    packed = pixels.view(np.uint32).reshape(-1)
+    # Bail out on a sample before sorting every pixel
+    if len(np.unique(packed[::97])) > 256:
+        return None
+    colors, indices = np.unique(packed, return_inverse=True)
+    if len(colors) > 256:
+        return None
+
+    palette = colors.view(np.uint8).reshape(-1, 4)
+    image = Image.fromarray(indices.astype(np.uint8).reshape(pixels.shape[:2]), "P")
+    if opaque:
+        image.putpalette(palette[:, :3].tobytes(), rawmode="RGB")
+    else:
+        image.putpalette(palette.tobytes(), rawmode="RGBA")
+    return image
+
+
+def _lossless_candidates(image):
+    """The image itself plus smaller color types that hold exactly the same pixels."""
+    candidates = [image]
+    if image.mode not in ("1", "L", "LA", "P", "PA", "RGB", "RGBA"):
+        return candidates
+
+    rgba = image.convert("RGBA")
+    pixels = np.asarray(rgba)
+    opaque = bool(np.all(pixels[..., 3] == 255))
+    gray = bool(np.all(pixels[..., 0] == pixels[..., 1]) and np.all(pixels[..., 1] == pixels[..., 2]))
+
+    if gray:
+        candidates.append(rgba.convert("L") if opaque else rgba.convert("LA"))
+    else:
+        candidates.append(rgba.convert("RGB") if opaque else rgba)
+
+    palette_image = _palette_image(pixels, opaque)
+    if palette_image is not None:
+        candidates.append(palette_image)
+    return candidates
+
+
+def _smallest_png(candidates):
+    """Encode every candidate with every zlib setting and return the smallest PNG bytes."""
+    best = None
+    for candidate in candidates:
+        for level in PNG_COMPRESS_LEVELS:
+            for compress_type in PNG_COMPRESS_TYPES:
+                output = io.BytesIO()
+                # No pnginfo/exif/icc_profile so only the chunks needed to display it are written
+                candidate.save(output, format="PNG", compress_level=level, compress_type=compress_type, icc_profile=None)
+                if best is None or output.tell() < len(best):
+                    best = output.getvalue()
+    return best
+
+
+def optimize_png(filepath, max_size=None):
+    """
+    Losslessly recompress a single PNG, optionally clamping it first.
+
+    Returns:
+        tuple: (old_size, new_size, changed)
+    """
+    original_size = os.path.getsize(filepath)
+    try:
+        bit_depth = _png_bit_depth(filepath)
+        if bit_depth is None:
+            return original_size, original_size, False
+
+        with Image.open(filepath) as image:
+            if getattr(image, "is_animated", False):
+                return original_size, original_size, False
+
+            w, h = image.size
+            resized = False
+            if max_size is not None and (w > max_size or h > max_size):
+                scale = max_size / max(w, h)
+                new_size = (int(w * scale), int(h * scale))
+                image = image.resize(new_size, resample=Image.Resampling.LANCZOS, reducing_gap=PNG_REDUCING_GAP)
+                resized = True
+            elif bit_depth == 16:
+                # Pillow loads 16 bit RGB as 8 bit, saving it again wouldn't be lossless
+                return original_size, original_size, False
+            else:
+                image.load()
+
+            best = _smallest_png(_lossless_candidates(image))
+
+        if not resized and len(best) >= original_size:
+            return original_size, original_size, False
+
+        with open(filepath, "wb") as f:
+            f.write(best)
+
+        if resized:
+            print(f"Resized {filepath} from {w}x{h} to {image.width}x{image.height}, {format_size(original_size)} -> {format_size(len(best))}")
+        else:
+            print(f"Recompressed {filepath}, {format_size(original_size)} -> {format_size(len(best))}")
+        return original_size, len(best), True
+    except Exception as e:
+        print(f"Error processing {filepath}: {e}")
+        return original_size, original_size, False
+
+
+def optimize_pngs(folder, max_size=None, progress_callback=None, workers=1):
+    """
+    Losslessly recompress all PNGs in the folder on a worker pool.
+
+    Args:
+        folder: Path to the folder containing PNG files
+        max_size: Optional clamp size, larger PNGs are resized first
+        progress_callback: Optional callback(current, total) for progress updates
+        workers: Number of worker processes to spread the files over
+    """
+    total_size = 0
+    total_new_size = 0
+    total_changed_files = 0
+
+    png_files = []
+    for path, subdirs, files in os.walk(folder):
+        for name in files:
+            if name.lower().endswith(".png"):
+                png_files.append(os.path.join(path, name))
+
+    items = [(filepath, max_size) for filepath in png_files]
+    for old_size, new_size, changed in run_parallel(optimize_png, items, workers, progress_callback):
+        total_size += old_size
+        total_new_size += new_size
+        if changed:
+            total_changed_files += 1
+
+    print("="*60)
+    print(f"Optimized {total_changed_files} of {len(png_files)} PNG files")
+    print("Reduced size by ", format_percentage(total_size - total_new_size, total_size))
+    print("Reduced size by ", format_size(total_size - total_new_size))
+    print("="*60)
+    return total_size - total_new_size, total_changed_files
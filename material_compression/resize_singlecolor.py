@@ -1,28 +1,67 @@
 import os
 from PIL import Image
 from sourcepp import vtfpp
+from material_compression.imagestats import is_uniform_opaque
+from material_compression.resizelib import isSingleColorVTF, resizeSingleColorVTF, SINGLE_COLOR_SIZE
+from material_compression.vtfheader import scan_vtf_headers
 from utils.formatting import format_size
+from utils.parallel import run_parallel
 
 
 def is_single_color(image):
     if image.mode != 'RGBA':
         image = image.convert('RGBA')
-    
-    r, g, b, a = image.split()
-    alpha_colors = a.getcolors(maxcolors=image.width * image.height)
-    if alpha_colors is None or len(alpha_colors) != 1:
-        return False
-    
-    if alpha_colors[0][1] != 255:
-        return False
-
-    rgb_image = Image.new('RGB', image.size)
-    rgb_image.paste(image, mask=image.split()[3])
-    colors = rgb_image.getcolors(maxcolors=image.width * image.height)
-    return colors is not None and len(colors) == 1
-
-
-def resize_single_color_images(folder, progress_callback=None):
+
+    return is_uniform_opaque(image.tobytes())
+
+
+def resize_single_color_file(filepath):
+    """Resize a single image if it only contains one color, returns (old_size, new_size, resized)."""
+    original_size = 0
+    try:
+        original_size = os.path.getsize(filepath)
+
+        if filepath.lower().endswith('.vtf'):
+            try:
+                vtf = vtfpp.VTF(filepath)
+                if not vtf:
+                    # vtfpp doesn't raise for files it can't parse, it gives an empty VTF instead
+                    print(f"Error processing VTF {filepath}: not a valid VTF")
+                    return original_size, original_size, False
+                original_width = vtf.width
+                original_height = vtf.height
+
+                if isSingleColorVTF(vtf) and resizeSingleColorVTF(vtf):
+                    vtf.bake_to_file(filepath)
+
+                    new_size = os.path.getsize(filepath)
+                    print(f"Resized single-color VTF {filepath} from ({original_width}x{original_height}) to 4x4 saving {format_size(original_size - new_size)}")
+                    return original_size, new_size, True
+            except Exception as e:
+                print(f"Error processing VTF {filepath}: {e}")
+            return original_size, original_size, False
+
+        image = Image.open(filepath)
+
+        if is_single_color(image) and (image.width != 4 or image.height != 4):
+            image = image.resize((4, 4), resample=Image.Resampling.NEAREST)
+
+            if filepath.lower().endswith(('.png', '.bmp')):
+                image.save(filepath)
+            else:
+                image.save(filepath, quality=95)
+
+            new_size = os.path.getsize(filepath)
+            print(f"Resized single-color image {filepath} to 4x4")
+            return original_size, new_size, True
+
+    except Exception as e:
+        print(f"Error processing {filepath}: {e}")
+
+    return original_size, original_size, False
+
+
+def resize_single_color_images(folder, progress_callback=None, workers=1):
     total_size = 0
     total_resized = 0
     total_resized_files = 0
@@ -35,64 +74,24 @@ def resize_single_color_images(folder, progress_callback=None):
             if name.lower().endswith(image_extensions):
                 image_files.append(os.path.join(path, name))
 
-    total_image_count = len(image_files)
-    processed = 0
-
+    # VTFs that already have the single-color size can't get any smaller
+    headers = scan_vtf_headers([filepath for filepath in image_files if filepath.lower().endswith('.vtf')])
+    todo_files = []
     for filepath in image_files:
-        try:
-            original_size = os.path.getsize(filepath)
-            total_size += original_size
-
-            if filepath.lower().endswith('.vtf'):
-                try:
-                    vtf = vtfpp.VTF(filepath)
-                    image_data = vtf.get_image_data_as_rgba8888(0)
-                    image = Image.frombytes("RGBA", (vtf.width, vtf.height), image_data)
-
-                    if is_single_color(image):
-                        original_width = vtf.width
-                        original_height = vtf.height
-                        if original_width == 8 and original_height == 8:
-                            total_resized += original_size
-                            continue
-
-                        vtf.set_size(8, 8, vtfpp.ImageConversion.ResizeFilter.NICE)
-                        vtf.bake_to_file(filepath)
-
-                        new_size = os.path.getsize(filepath)
-                        total_resized += new_size
-                        total_resized_files += 1
-                        print(f"Resized single-color VTF {filepath} from ({original_width}x{original_height}) to 4x4 saving {format_size(original_size - new_size)}")
-                    else:
-                        total_resized += original_size
-                except Exception as e:
-                    print(f"Error processing VTF {filepath}: {e}")
-                    total_resized += original_size
-            else:
-                image = Image.open(filepath)
-
-                if is_single_color(image) and (image.width != 4 or image.height != 4):
-                    image = image.resize((4, 4), resample=Image.Resampling.NEAREST)
-
-                    if filepath.lower().endswith(('.png', '.bmp')):
-                        image.save(filepath)
-                    else:
-                        image.save(filepath, quality=95)
-
-                    new_size = os.path.getsize(filepath)
-                    total_resized += new_size
-                    total_resized_files += 1
-                    print(f"Resized single-color image {filepath} to 4x4")
-                else:
-                    total_resized += original_size
-
-        except Exception as e:
-            print(f"Error processing {filepath}: {e}")
-            total_resized += original_size
-
-        if progress_callback:
-            processed += 1
-            progress_callback(processed, total_image_count)
+        header = headers.get(filepath)
+        if header is not None and header.width == SINGLE_COLOR_SIZE and header.height == SINGLE_COLOR_SIZE:
+            file_size = os.path.getsize(filepath)
+            total_size += file_size
+            total_resized += file_size
+        else:
+            todo_files.append(filepath)
+
+    items = [(filepath,) for filepath in todo_files]
+    for original_size, new_size, resized in run_parallel(resize_single_color_file, items, workers, progress_callback):
+        total_size += original_size
+        total_resized += new_size
+        if resized:
+            total_resized_files += 1
 
     if total_resized_files > 0:
         total_saved_mb = round((total_size - total_resized) / 1000000, 2)
@@ -1,7 +1,35 @@
-from PIL import Image
 from sourcepp import vtfpp
+from material_compression.imagestats import PixelStats, analyze_rgba_images, is_uniform_opaque, luminance, alpha_channel, ssim
 
-def resizeVTFImage(vtf: vtfpp.VTF, path: str, max_size: int = 1024, best_format: vtfpp.ImageFormat = vtfpp.ImageFormat.DXT1) -> bool:
+SINGLE_COLOR_SIZE = 8
+# Smallest mip side that still says something about the colors of the full image
+SINGLE_COLOR_MIN_MIP_SIZE = 4
+
+# Auto clamp never goes below this size
+AUTO_CLAMP_MIN_SIZE = 32
+# Candidates are compared against the original downscaled to at most this size
+AUTO_CLAMP_COMPARE_SIZE = 1024
+AUTO_CLAMP_DEFAULT_THRESHOLD = 0.98
+
+def iterVTFImages(vtf: vtfpp.VTF, mip: int = 0):
+    """RGBA8888 data of every frame, face and slice of a mip, decoded one at a time."""
+    for frame in range(vtf.frame_count):
+        for face in range(vtf.face_count):
+            for depth_slice in range(vtf.depth_for_mip(mip)):
+                yield vtf.get_image_data_as_rgba8888(mip, frame, face, depth_slice)
+
+
+def isSingleImageVTF(vtf: vtfpp.VTF) -> bool:
+    return vtf.frame_count == 1 and vtf.face_count == 1 and vtf.depth == 1
+
+
+def analyzeVTF(vtf: vtfpp.VTF) -> PixelStats:
+    """Pixel stats of the largest mip over all frames, faces and slices."""
+    return analyze_rgba_images(iterVTFImages(vtf))
+
+
+def clampVTFSize(vtf: vtfpp.VTF, path: str, max_size: int = 1024) -> bool:
+    """Resize the VTF (all frames, faces and slices) in memory so neither side is larger than max_size, doesn't save it."""
     w = vtf.width
     h = vtf.height
     neww = w
@@ -18,49 +46,182 @@ def resizeVTFImage(vtf: vtfpp.VTF, path: str, max_size: int = 1024, best_format:
         neww_int = int(neww)
         newh_int = int(newh)
         vtf.set_size(neww_int, newh_int, vtfpp.ImageConversion.ResizeFilter.NICE)
-        vtf.bake_to_file(path)
         print(f"✓ {path} - resized from {w}x{h} to {neww_int}x{newh_int}")
         return True
     return False
 
 
-def cleanupVTF(path: str, max_size: int = 9999) -> bool:
-    if not path.endswith(".vtf"):
+def _clampDims(width: int, height: int, max_size: int) -> tuple[int, int]:
+    # Same rounding as clampVTFSize
+    if width <= max_size and height <= max_size:
+        return width, height
+    scale = max_size / max(width, height)
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def _resizeRGBA(data: bytes, width: int, height: int, new_width: int, new_height: int) -> bytes:
+    if (width, height) == (new_width, new_height):
+        return data
+    return vtfpp.ImageConversion.resize_image_data(data, vtfpp.ImageFormat.RGBA8888, width, new_width, height, new_height,
+                                                   False, False, vtfpp.ImageConversion.ResizeFilter.NICE)
+
+
+def findAutoClampSize(image_data: bytes, width: int, height: int, max_size: int = 1024, threshold: float = AUTO_CLAMP_DEFAULT_THRESHOLD) -> int:
+    """
+    Find the smallest power of two clamp size whose result still looks like the original.
+
+    Each candidate is downscaled from the original, scaled back up and compared to the
+    original with SSIM on the luma (and alpha, if the image has any). The comparison runs at
+    AUTO_CLAMP_COMPARE_SIZE, or at twice the candidate size for larger candidates so the
+    lost detail can still be seen. Smaller sizes never look better, so the candidates are
+    binary searched.
+
+    Args:
+        image_data: RGBA8888 data of the largest mip
+        width: Width of image_data
+        height: Height of image_data
+        max_size: Size to fall back to when no smaller candidate passes
+        threshold: Minimum SSIM (0-1) a candidate needs to be accepted
+
+    Returns:
+        int: The clamp size to use, at most max_size
+    """
+    # Reference luma/alpha per comparison resolution, most searches only need one
+    references = {}
+
+    def reference(compare_size):
+        compare_w, compare_h = _clampDims(width, height, compare_size)
+        if (compare_w, compare_h) not in references:
+            scaled = _resizeRGBA(image_data, width, height, compare_w, compare_h)
+            references[compare_w, compare_h] = (compare_w, compare_h, luminance(scaled, compare_w, compare_h),
+                                                alpha_channel(scaled, compare_w, compare_h))
+        return references[compare_w, compare_h]
+
+    has_alpha = bool(reference(AUTO_CLAMP_COMPARE_SIZE)[3].min() < 255)
+
+    def score(size):
+        compare_w, compare_h, ref_luma, ref_alpha = reference(max(AUTO_CLAMP_COMPARE_SIZE, size * 2))
+        small_w, small_h = _clampDims(width, height, size)
+        small = _resizeRGBA(image_data, width, height, small_w, small_h)
+        restored = _resizeRGBA(small, small_w, small_h, compare_w, compare_h)
+        result = ssim(ref_luma, luminance(restored, compare_w, compare_h))
+        if has_alpha:
+            result = min(result, ssim(ref_alpha, alpha_channel(restored, compare_w, compare_h)))
+        return result
+
+    # Clamping to the image's own size or more changes nothing
+    limit = min(max_size, max(width, height))
+    candidates = []
+    size = AUTO_CLAMP_MIN_SIZE
+    while size < limit:
+        candidates.append(size)
+        size *= 2
+
+    best = max_size
+    low, high = 0, len(candidates) - 1
+    while low <= high:
+        mid = (low + high) // 2
+        if score(candidates[mid]) >= threshold:
+            best = candidates[mid]
+            high = mid - 1
+        else:
+            low = mid + 1
+    return best
+
+
+def resizeVTFImage(vtf: vtfpp.VTF, path: str, max_size: int = 1024, best_format: vtfpp.ImageFormat = vtfpp.ImageFormat.DXT1) -> bool:
+    if clampVTFSize(vtf, path, max_size):
+        vtf.bake_to_file(path)
+        return True
+    return False
+
+
+def getBestFormat(stats: PixelStats) -> vtfpp.ImageFormat:
+    if stats.translucent:
+        return vtfpp.ImageFormat.DXT5
+    return vtfpp.ImageFormat.DXT1
+
+
+def setBestFormat(vtf: vtfpp.VTF, stats: PixelStats) -> bool:
+    """Convert the VTF in memory to DXT1/DXT5 depending on its alpha, doesn't save it."""
+    best_format = getBestFormat(stats)
+    if vtf.format != best_format:
+        vtf.set_format(best_format)
+        return True
+    return False
+
+
+def _allUniformOpaque(vtf: vtfpp.VTF, mip: int) -> bool:
+    # Every image of the mip is uniform and they all share the same color, a VTF without images isn't
+    first = None
+    for image_data in iterVTFImages(vtf, mip):
+        if first is None:
+            first = image_data[:4]
+        if image_data[:4] != first or not is_uniform_opaque(image_data):
+            return False
+    return first is not None
+
+
+def isSingleColorVTF(vtf: vtfpp.VTF) -> bool:
+    """
+    Check if the VTF is opaque and only contains one color, in every frame, face and slice.
+
+    The smallest mip that's at least SINGLE_COLOR_MIN_MIP_SIZE wide and high is checked
+    first, most textures are already clearly not uniform there. Only textures that pass
+    get mip 0 decoded, which is then checked with a sparse sample before every pixel.
+    """
+    mip = vtf.mip_count - 1
+    while mip > 0 and min(vtf.width_for_mip(mip), vtf.height_for_mip(mip)) < SINGLE_COLOR_MIN_MIP_SIZE:
+        mip -= 1
+
+    if mip > 0 and not _allUniformOpaque(vtf, mip):
+        return False
+    return _allUniformOpaque(vtf, 0)
+
+
+def resizeSingleColorVTF(vtf: vtfpp.VTF) -> bool:
+    """Shrink a single-color VTF in memory to SINGLE_COLOR_SIZE, doesn't save it."""
+    if vtf.width == SINGLE_COLOR_SIZE and vtf.height == SINGLE_COLOR_SIZE:
         return False
-    
+    vtf.set_size(SINGLE_COLOR_SIZE, SINGLE_COLOR_SIZE, vtfpp.ImageConversion.ResizeFilter.NICE)
+    return True
+
+
+def removeVTFMipmaps(vtf: vtfpp.VTF) -> bool:
+    """Drop all mipmaps of the VTF in memory, doesn't save it."""
+    if vtf.mip_count <= 1:
+        return False
+    vtf.mip_count = 0
+    return True
+
+
+def cleanupVTF(path: str, max_size: int = 9999, quality_threshold: float | None = None) -> bool | None:
+    """Convert and clamp a VTF, True if it was changed, False if it needed no changes, None if it couldn't be processed."""
+    if not path.endswith(".vtf"):
+        return None
+
     try:
         vtf = vtfpp.VTF(path)
     except Exception as e:
         print(f"✗ {path} - failed to load VTF: {e}")
-        return False
+        return None
+    if not vtf:
+        # vtfpp doesn't raise for files it can't parse, it gives an empty VTF instead
+        print(f"✗ {path} - failed to load VTF: not a valid VTF")
+        return None
 
     try:
-        image_data = vtf.get_image_data_as_rgba8888(0)
-        image = Image.frombytes("RGBA", (vtf.width, vtf.height), image_data)
+        stats = analyzeVTF(vtf)
+        if quality_threshold is not None and isSingleImageVTF(vtf):
+            max_size = findAutoClampSize(vtf.get_image_data_as_rgba8888(0), vtf.width, vtf.height, max_size, quality_threshold)
     except Exception as e:
         print(f"✗ {path} - failed to extract image data: {e}")
-        return False
-
-    _, _, _, a = image.split()
+        return None
 
-    best_format = vtfpp.ImageFormat.DXT1
-    if a.getextrema()[0] < 255:
-        best_format = vtfpp.ImageFormat.DXT5
-
-    format_changed = False
-    if vtf.format != best_format:
-        vtf.set_format(best_format)
-        format_changed = True
-
-    if vtf.frame_count > 1:
-        print("Skipping resize for animated VTF:", path)
-        if format_changed:
-            vtf.bake_to_file(path)
-            return True
-        return False
+    format_changed = setBestFormat(vtf, stats)
 
     if vtf.width > max_size or vtf.height > max_size:
-        return resizeVTFImage(vtf, path, max_size, best_format)
+        return resizeVTFImage(vtf, path, max_size, getBestFormat(stats))
 
     if format_changed:
         vtf.bake_to_file(path)
@@ -0,0 +1,47 @@
+from utils.cache import open_cache_db
+
+# Bump when the VTF optimizations change so old results are redone
+CACHE_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS optimized_vtfs (
+    digest TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    PRIMARY KEY (digest, operation)
+);
+"""
+
+_connection = None
+
+
+def _db():
+    # One connection per process, worker processes open their own on first use.
+    global _connection
+    if _connection is None:
+        _connection = open_cache_db("optimized_vtfs.db", _SCHEMA)
+    return _connection
+
+
+def operation_key(name: str, **params) -> str:
+    """Key describing an operation and its parameters, eg "cleanupVTF:max_size=1024"."""
+    args = ",".join(f"{key}={value}" for key, value in sorted(params.items()))
+    return f"v{CACHE_VERSION}:{name}:{args}"
+
+
+def is_optimized(digest: str, operation: str) -> bool:
+    """Check if a VTF with this content hash is already known to be the output of operation."""
+    row = _db().execute(
+        "SELECT 1 FROM optimized_vtfs WHERE digest = ? AND operation = ?",
+        (digest, operation),
+    ).fetchone()
+    return row is not None
+
+
+def mark_optimized(digests, operation: str):
+    """Remember that VTFs with these content hashes don't change anymore when running operation."""
+    connection = _db()
+    with connection:
+        connection.executemany(
+            "INSERT OR IGNORE INTO optimized_vtfs (digest, operation) VALUES (?, ?)",
+            [(digest, operation) for digest in digests],
+        )
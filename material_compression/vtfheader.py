@@ -0,0 +1,77 @@
+import struct
+from typing import NamedTuple
+from sourcepp import vtfpp
+
+# Everything up to and including the resource count of a 7.3+ header
+HEADER_READ_SIZE = 80
+
+_FLAG_ENVMAP = vtfpp.VTF.Flags.V0_ENVMAP.value
+_FLAG_ONE_BIT_ALPHA = vtfpp.VTF.Flags.V0_ONE_BIT_ALPHA.value
+_FLAG_MULTI_BIT_ALPHA = vtfpp.VTF.Flags.V0_MULTI_BIT_ALPHA.value
+
+
+class VTFHeader(NamedTuple):
+    version: tuple[int, int]
+    width: int
+    height: int
+    depth: int
+    flags: int
+    format: vtfpp.ImageFormat | None
+    mip_count: int
+    frame_count: int
+    face_count: int
+
+    @property
+    def has_alpha_flags(self) -> bool:
+        return bool(self.flags & (_FLAG_ONE_BIT_ALPHA | _FLAG_MULTI_BIT_ALPHA))
+
+
+def read_vtf_header(path: str) -> VTFHeader:
+    """Read the header of a VTF without loading the image data, raises ValueError for non VTF files."""
+    with open(path, "rb") as f:
+        data = f.read(HEADER_READ_SIZE)
+
+    if len(data) < 64 or data[:4] != b"VTF\0":
+        raise ValueError("not a VTF file")
+
+    major, minor = struct.unpack_from("<2I", data, 4)
+    width, height, flags, frame_count, start_frame = struct.unpack_from("<2HI2H", data, 16)
+    (high_res_format,) = struct.unpack_from("<i", data, 52)
+    mip_count = data[56]
+
+    depth = 1
+    if (major, minor) >= (7, 2):
+        (depth,) = struct.unpack_from("<H", data, 63)
+
+    face_count = 1
+    if flags & _FLAG_ENVMAP:
+        # Before 7.5 cubemaps can carry a 7th spheremap face
+        face_count = 7 if minor < 5 and start_frame != 0xFFFF else 6
+
+    try:
+        image_format = vtfpp.ImageFormat(high_res_format)
+    except ValueError:
+        image_format = None
+
+    return VTFHeader((major, minor), width, height, max(depth, 1), flags, image_format, mip_count, max(frame_count, 1), face_count)
+
+
+def scan_vtf_headers(paths) -> dict[str, VTFHeader]:
+    """Read the headers of all the given VTFs, files that can't be read are left out of the table."""
+    headers = {}
+    for path in paths:
+        try:
+            headers[path] = read_vtf_header(path)
+        except (OSError, ValueError, struct.error):
+            pass
+    return headers
+
+
+def fits_clamp(header: VTFHeader, max_size: int) -> bool:
+    """True if cleanupVTF wouldn't resize this VTF."""
+    return header.width <= max_size and header.height <= max_size
+
+
+def is_opaque_dxt1(header: VTFHeader) -> bool:
+    """True if the VTF is DXT1 without alpha, the format cleanupVTF would pick for it anyway."""
+    return header.format == vtfpp.ImageFormat.DXT1 and not header.has_alpha_flags
@@ -0,0 +1,196 @@
+import mmap
+import subprocess
+from typing import NamedTuple
+import numpy as np
+import pydub
+from pydub.utils import mediainfo_json
+from sound_compression.riff import pcm_samples, scan_wav
+
+# Frames per analyzed window, also the FFT size
+WINDOW_FRAMES = 4096
+# Windows spread evenly over a WAV
+WAV_WINDOWS = 32
+# Seconds between windows when the audio is streamed from ffmpeg and its length is unknown
+STREAM_WINDOW_INTERVAL = 2.0
+
+# Stereo files whose channels are at least this similar are encoded as mono (1 - side energy ratio)
+DEFAULT_MONO_SIMILARITY = 0.9999
+# Spectrum bins quieter than the loudest bin by more than this don't count as content
+DEFAULT_BANDWIDTH_DB = -80.0
+# Sample rates a band-limited file can be lowered to, the Source mixer plays anything else at the wrong pitch
+RESAMPLE_RATES = (11025, 22050, 44100)
+# Keep some room between the content and the new Nyquist frequency for the resampler's filter
+RESAMPLE_MARGIN = 1.05
+
+
+class AudioPlan(NamedTuple):
+    channels: int
+    sample_rate: int
+    source_channels: int
+    source_sample_rate: int
+    similarity: float | None
+    bandwidth: float | None
+
+    @property
+    def downmix(self) -> bool:
+        return self.channels < self.source_channels
+
+    @property
+    def resample(self) -> bool:
+        return self.sample_rate != self.source_sample_rate
+
+    def ffmpeg_parameters(self) -> list[str]:
+        """Extra ffmpeg output arguments that apply this plan."""
+        parameters = []
+        if self.downmix:
+            parameters.extend(["-ac", str(self.channels)])
+        if self.resample:
+            parameters.extend(["-ar", str(self.sample_rate)])
+        return parameters
+
+    def describe(self) -> str:
+        decisions = []
+        if self.downmix:
+            decisions.append(f"mono (channel similarity {self.similarity:.5f})")
+        if self.resample:
+            decisions.append(f"{self.source_sample_rate} -> {self.sample_rate} Hz (content up to {self.bandwidth / 1000:.1f} kHz)")
+        return ", ".join(decisions) if decisions else "kept as is"
+
+
+def analyze_windows(windows, channels, sample_rate, mono_similarity=DEFAULT_MONO_SIMILARITY, bandwidth_db=DEFAULT_BANDWIDTH_DB) -> AudioPlan:
+    """
+    Decide on downmixing and resampling from sampled windows of the audio.
+
+    Args:
+        windows: Iterable of (frames, channels) float arrays, at most WINDOW_FRAMES long
+        channels: Channel count of the source
+        sample_rate: Sample rate of the source
+        mono_similarity: Minimum channel similarity to downmix stereo to mono, None to never downmix
+        bandwidth_db: Level relative to the loudest frequency that still counts as content, None to never resample
+    """
+    spectrum = np.zeros(WINDOW_FRAMES // 2 + 1)
+    taper = np.hanning(WINDOW_FRAMES)
+    left_right = 0.0
+    channel_energy = 0.0
+
+    for window in windows:
+        frames = len(window)
+        if frames == 0:
+            continue
+        if channels == 2:
+            left_right += float(np.dot(window[:, 0], window[:, 1]))
+            channel_energy += float(np.sum(window * window))
+
+        padded = np.zeros((WINDOW_FRAMES, window.shape[1]))
+        padded[:frames] = window * taper[:frames, None]
+        spectrum += np.sum(np.abs(np.fft.rfft(padded, axis=0)) ** 2, axis=1)
+
+    similarity = None
+    new_channels = channels
+    if channels == 2:
+        # 1 - |L - R|^2 / (|L|^2 + |R|^2), only 1 when both channels are identical
+        similarity = 2 * left_right / channel_energy if channel_energy > 0 else 1.0
+        if mono_similarity is not None and similarity >= mono_similarity:
+            new_channels = 1
+
+    bandwidth = None
+    new_sample_rate = sample_rate
+    # Silent audio has no bandwidth to speak of, leave its rate alone
+    if bandwidth_db is not None and spectrum.max() > 0:
+        loud_bins = np.flatnonzero(spectrum >= spectrum.max() * 10 ** (bandwidth_db / 10))
+        bandwidth = (loud_bins[-1] + 1) * sample_rate / WINDOW_FRAMES
+        for rate in RESAMPLE_RATES:
+            if rate < sample_rate and rate / 2 >= bandwidth * RESAMPLE_MARGIN:
+                new_sample_rate = rate
+                break
+
+    return AudioPlan(new_channels, new_sample_rate, channels, sample_rate, similarity, bandwidth)
+
+
+def analyze_wav(path, mono_similarity=DEFAULT_MONO_SIMILARITY, bandwidth_db=DEFAULT_BANDWIDTH_DB) -> AudioPlan | None:
+    """analyze_windows for WAV_WINDOWS windows read from a memory map, None for sample formats it can't read."""
+    info = scan_wav(path)
+    # Float samples would be read as integers, so only PCM is analyzed
+    if not info.is_pcm or info.bits_per_sample not in (8, 16, 24, 32):
+        return None
+    if info.channel_count == 0 or info.frame_count == 0:
+        return None
+
+    sample_width = info.bits_per_sample // 8
+    frame_width = info.frame_width
+    window_frames = min(WINDOW_FRAMES, info.frame_count)
+    starts = np.unique(np.linspace(0, info.frame_count - window_frames, WAV_WINDOWS).astype(np.int64))
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        def windows():
+            for start in starts:
+                offset = info.data_offset + int(start) * frame_width
+                raw = data[offset:offset + window_frames * frame_width]
+                yield pcm_samples(raw, sample_width, unsigned_8bit=True).reshape(-1, info.channel_count).astype(np.float64)
+
+        return analyze_windows(windows(), info.channel_count, info.sample_rate, mono_similarity, bandwidth_db)
+
+
+def analyze_file(path, mono_similarity=DEFAULT_MONO_SIMILARITY, bandwidth_db=DEFAULT_BANDWIDTH_DB) -> AudioPlan | None:
+    """
+    analyze_windows for any file ffmpeg can decode, eg MP3s.
+
+    ffmpeg decodes the file into a pipe and only one window every STREAM_WINDOW_INTERVAL
+    seconds is kept, so memory stays flat. Returns None if ffprobe finds no audio.
+    """
+    streams = [stream for stream in mediainfo_json(path).get("streams", []) if stream.get("codec_type") == "audio"]
+    if not streams:
+        return None
+    channels = int(streams[0]["channels"])
+    sample_rate = int(streams[0]["sample_rate"])
+
+    command = [pydub.AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-i", path,
+               "-map", "0:a:0", "-f", "f32le", "-acodec", "pcm_f32le", "-"]
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    frame_width = 4 * channels
+    skip_bytes = max(int(STREAM_WINDOW_INTERVAL * sample_rate) - WINDOW_FRAMES, 0) * frame_width
+
+    def windows():
+        while True:
+            raw = process.stdout.read(WINDOW_FRAMES * frame_width)
+            raw = raw[:len(raw) - len(raw) % frame_width]
+            if raw:
+                yield np.frombuffer(raw, dtype="<f4").reshape(-1, channels).astype(np.float64)
+            if len(raw) < WINDOW_FRAMES * frame_width:
+                return
+            remaining = skip_bytes
+            while remaining > 0:
+                skipped = process.stdout.read(min(remaining, 1 << 20))
+                if not skipped:
+                    return
+                remaining -= len(skipped)
+
+    try:
+        return analyze_windows(windows(), channels, sample_rate, mono_similarity, bandwidth_db)
+    finally:
+        process.stdout.close()
+        process.wait()
+
+
+def plan_conversion(path, analysis) -> AudioPlan | None:
+    """
+    Analyze a file before converting it.
+
+    Args:
+        path: Audio file, WAVs are read directly, anything else goes through ffmpeg
+        analysis: (mono_similarity, bandwidth_db) or None to skip the analysis
+
+    Returns:
+        AudioPlan, or None if analysis is disabled or the file couldn't be analyzed
+    """
+    if analysis is None:
+        return None
+    mono_similarity, bandwidth_db = analysis
+    try:
+        if path.lower().endswith(".wav"):
+            return analyze_wav(path, mono_similarity, bandwidth_db)
+        return analyze_file(path, mono_similarity, bandwidth_db)
+    except Exception:
+        # The conversion itself reports files that are really broken
+        return None
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import pydub
+from pydub.exceptions import CouldntEncodeError
+
+# "ffmpeg" streams the files through ffmpeg, "pydub" decodes them into an AudioSegment first
+BACKENDS = ("ffmpeg", "pydub")
+DEFAULT_BACKEND = "ffmpeg"
+
+
+def transcode(source, target, format, codec=None, parameters=None):
+    """
+    Convert source to target with a single ffmpeg call that reads and writes both files itself.
+
+    Uses the same encoder settings as AudioSegment.export, but the audio never passes
+    through Python so memory use stays flat regardless of the length of the file.
+    Like the pydub round trip, metadata and cover art are not carried over.
+
+    Args:
+        source: Path of the audio file to convert
+        target: Path to write the converted file to, overwritten if it exists
+        format: ffmpeg output format, eg "ogg" or "mp3"
+        codec: Audio encoder, defaults to the one pydub would use for format
+        parameters: Extra ffmpeg output arguments, eg ["-q:a", "4"]
+    """
+    if codec is None:
+        codec = pydub.AudioSegment.DEFAULT_CODECS.get(format)
+
+    command = [pydub.AudioSegment.converter, "-y", "-hide_banner", "-loglevel", "error", "-i", source,
+               "-vn", "-map_metadata", "-1"]
+    if codec is not None:
+        command.extend(["-acodec", codec])
+    if parameters is not None:
+        command.extend(parameters)
+    command.extend(["-f", format, target])
+
+    result = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        # Don't leave a half written file behind that looks like a finished conversion
+        if os.path.exists(target):
+            os.remove(target)
+        raise CouldntEncodeError(
+            f"Encoding failed. ffmpeg returned error code: {result.returncode}\n\n"
+            f"{result.stderr.decode(errors='replace')}"
+        )
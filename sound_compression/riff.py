@@ -0,0 +1,128 @@
+import struct
+from typing import NamedTuple
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# WAVE_FORMAT_EXTENSIBLE subformat GUIDs are a format tag followed by these 14 bytes
+KSDATAFORMAT_GUID_TAIL = bytes.fromhex("000000001000800000aa00389b71")
+
+
+class WavInfo(NamedTuple):
+    format_tag: int
+    channel_count: int
+    sample_rate: int
+    bits_per_sample: int
+    data_offset: int
+    data_size: int
+    cue_count: int
+    loop_count: int
+    # Format tag of the subformat GUID of WAVE_FORMAT_EXTENSIBLE files, None for other files or unknown GUIDs
+    subformat_tag: int | None = None
+
+    @property
+    def is_pcm(self) -> bool:
+        """True for integer PCM, directly or as the subformat of WAVE_FORMAT_EXTENSIBLE."""
+        if self.format_tag == WAVE_FORMAT_EXTENSIBLE:
+            return self.subformat_tag == WAVE_FORMAT_PCM
+        return self.format_tag == WAVE_FORMAT_PCM
+
+    @property
+    def frame_width(self) -> int:
+        return self.channel_count * (self.bits_per_sample // 8)
+
+    @property
+    def frame_count(self) -> int:
+        return self.data_size // self.frame_width if self.frame_width else 0
+
+    @property
+    def duration(self) -> float:
+        return self.frame_count / self.sample_rate if self.sample_rate else 0.0
+
+    @property
+    def has_cues(self) -> bool:
+        return self.cue_count > 0
+
+    @property
+    def has_loops(self) -> bool:
+        return self.loop_count > 0
+
+
+def iter_riff_chunks(f, file_size: int):
+    """
+    Yield (chunk id, payload offset, payload size) of every top level chunk in a RIFF/WAVE file.
+
+    Only the 8 byte chunk headers are read. Sizes running past the end of the file are
+    clamped, like pydub does for truncated files.
+    """
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise ValueError("not a RIFF/WAVE file")
+
+    offset = 12
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        chunk_id, size = struct.unpack("<4sI", f.read(8))
+        payload = offset + 8
+        size = min(size, file_size - payload)
+        yield chunk_id, payload, size
+        # Chunks are padded to an even size
+        offset = payload + size + (size & 1)
+
+
+def scan_wav(path: str) -> WavInfo:
+    """
+    Read the format, data position and cue/loop counts of a WAV, raises ValueError if it has no fmt or data chunk.
+
+    Only the chunk headers and the few bytes of the fmt, cue and smpl chunks are read,
+    the sample data is seeked over.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        file_size = f.tell()
+        f.seek(0)
+
+        fmt = None
+        subformat_tag = None
+        data = None
+        cue_count = 0
+        loop_count = 0
+        for chunk_id, offset, size in iter_riff_chunks(f, file_size):
+            if chunk_id == b"fmt " and size >= 16 and fmt is None:
+                f.seek(offset)
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                if fmt[0] == WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                    # cbSize, valid bits and channel mask come before the subformat GUID
+                    f.seek(offset + 24)
+                    guid = f.read(16)
+                    if guid[2:] == KSDATAFORMAT_GUID_TAIL:
+                        (subformat_tag,) = struct.unpack("<H", guid[:2])
+            elif chunk_id == b"data" and data is None:
+                data = (offset, size)
+            elif chunk_id == b"cue " and size >= 4:
+                f.seek(offset)
+                (cue_count,) = struct.unpack("<I", f.read(4))
+            elif chunk_id == b"smpl" and size >= 36:
+                # The loop count follows 7 other 32-bit fields
+                f.seek(offset + 28)
+                (loop_count,) = struct.unpack("<I", f.read(4))
+
+    if fmt is None or data is None:
+        raise ValueError("no fmt or data chunk")
+    format_tag, channels, sample_rate, _, _, bits = fmt
+    return WavInfo(format_tag, channels, sample_rate, bits, data[0], data[1], cue_count, loop_count, subformat_tag)
+
+
+def pcm_samples(raw, sample_width: int, unsigned_8bit: bool = False) -> np.ndarray:
+    """Interleaved samples as int64, 24-bit is widened to 32-bit the same way pydub does it."""
+    if sample_width == 1:
+        samples = np.frombuffer(raw, dtype=np.uint8 if unsigned_8bit else np.int8).astype(np.int64)
+        return samples - 128 if unsigned_8bit else samples
+    if sample_width == 2:
+        return np.frombuffer(raw, dtype="<i2").astype(np.int64)
+    if sample_width == 3:
+        data = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int64)
+        samples = data[:, 0] | (data[:, 1] << 8) | (data[:, 2] << 16)
+        samples = (samples ^ 0x800000) - 0x800000
+        return samples * 256 + np.where(samples < 0, 255, 0)
+    return np.frombuffer(raw, dtype="<i4").astype(np.int64)
@@ -0,0 +1,120 @@
+import mmap
+import numpy as np
+from pydub.utils import db_to_float
+from sound_compression.riff import pcm_samples, scan_wav, WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE
+
+# Window starts (ms) evaluated per block while scanning backwards from the end
+SCAN_BLOCK_MS = 5000
+
+
+def last_nonsilent_end(read_samples, frame_count, frame_rate, channels, max_amplitude, silence_thresh=-55, min_silence_len=50):
+    """
+    End (ms) of the last non-silent range, scanning backwards from the end of the audio.
+
+    Gives the same result as pydub.silence.detect_nonsilent(...)[-1][1] with seek_step=1:
+    windows of min_silence_len ms every ms, silent if their RMS is at or below the
+    threshold, silent windows less than min_silence_len apart belong to the same range.
+    Only the trailing silence (plus one block) is ever read, audio that doesn't end in
+    silence is rejected after reading its last window.
+
+    Args:
+        read_samples: Callback(start_frame, end_frame) returning the interleaved samples as a NumPy array
+        frame_count: Number of frames of the audio
+        frame_rate: Frames per second
+        channels: Number of channels
+        max_amplitude: Largest possible sample value, like AudioSegment.max_possible_amplitude
+        silence_thresh: Silence threshold in dBFS
+        min_silence_len: Window length in ms
+
+    Returns:
+        tuple: (end_ms, duration_ms), end_ms is 0 if the whole audio is silent
+    """
+    duration = round(1000 * (frame_count / frame_rate))
+    if duration < min_silence_len:
+        return duration, duration
+
+    threshold = db_to_float(silence_thresh) * max_amplitude
+    frames_per_ms = frame_rate / 1000.0
+    last_start = duration - min_silence_len
+
+    def silent_windows(first_start, last_window_start):
+        starts = np.arange(first_start, last_window_start + 1)
+        start_frames = (starts * frames_per_ms).astype(np.int64)
+        end_frames = np.minimum(((starts + min_silence_len) * frames_per_ms).astype(np.int64), frame_count)
+        base = start_frames[0]
+        samples = read_samples(base, end_frames[-1]).reshape(-1, channels)
+        if max_amplitude <= 1 << 15:
+            energy = samples * samples
+        else:
+            # 32-bit squares overflow int64 sums, audioop sums them as doubles too
+            energy = samples.astype(np.float64) ** 2
+        cumulative = np.concatenate(([0], np.cumsum(energy.sum(axis=1))))
+        sums = cumulative[end_frames - base] - cumulative[start_frames - base]
+        counts = (end_frames - start_frames) * channels
+        rms = np.floor(np.sqrt(sums / np.maximum(counts, 1)))
+        return (rms <= threshold) | (counts == 0)
+
+    chain_start = last_start
+    block_end = last_start
+    while block_end >= 0:
+        block_start = max(0, block_end - SCAN_BLOCK_MS + 1)
+        silent = silent_windows(block_start, block_end)
+        if block_end == last_start and not silent[-1]:
+            return duration, duration
+
+        silent_starts = np.flatnonzero(silent) + block_start
+        chain = np.append(silent_starts[silent_starts < chain_start], chain_start)
+        gaps = np.flatnonzero(np.diff(chain) > min_silence_len)
+        if len(gaps) > 0:
+            return int(chain[gaps[-1] + 1]), duration
+
+        chain_start = int(chain[0])
+        if chain_start - block_start >= min_silence_len:
+            # min_silence_len non-silent windows in a row, nothing earlier can join the range
+            break
+        block_end = block_start - 1
+
+    return chain_start, duration
+
+
+def wav_tail_silence(path, silence_thresh=-55, min_silence_len=50):
+    """
+    last_nonsilent_end for a WAV, only the tail of its data chunk is read through a memory map.
+
+    Returns:
+        tuple: (end_ms, duration_ms), or None for WAVs that pydub would hand to ffmpeg
+    """
+    try:
+        layout = scan_wav(path)
+    except (OSError, ValueError):
+        return None
+    if layout.format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE) or layout.bits_per_sample not in (8, 16, 24, 32):
+        return None
+    if layout.channel_count == 0 or layout.sample_rate == 0 or layout.frame_count == 0:
+        return None
+
+    sample_width = layout.bits_per_sample // 8
+    frame_width = layout.frame_width
+    # pydub widens 24-bit audio to 32-bit before measuring it
+    max_amplitude = float(1 << (8 * (4 if sample_width == 3 else sample_width) - 1))
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        def read_samples(start_frame, end_frame):
+            start = layout.data_offset + start_frame * frame_width
+            end = layout.data_offset + end_frame * frame_width
+            return pcm_samples(data[start:end], sample_width, unsigned_8bit=True)
+
+        return last_nonsilent_end(read_samples, layout.frame_count, layout.sample_rate, layout.channel_count,
+                                  max_amplitude, silence_thresh, min_silence_len)
+
+
+def segment_tail_silence(audio, silence_thresh=-55, min_silence_len=50):
+    """last_nonsilent_end for an already decoded pydub AudioSegment."""
+    raw = audio.raw_data
+    frame_width = audio.frame_width
+
+    def read_samples(start_frame, end_frame):
+        return pcm_samples(raw[start_frame * frame_width:end_frame * frame_width], audio.sample_width)
+
+    return last_nonsilent_end(read_samples, int(audio.frame_count()), audio.frame_rate, audio.channels,
+                              audio.max_possible_amplitude, silence_thresh, min_silence_len)
@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import tempfile
+import xxhash
+from utils.cache import cache_path, file_digest
+from sound_compression.analysis import AudioPlan
+
+# Bump when the encoder settings or the analysis change so old encodes are redone
+CACHE_VERSION = 2
+# Encoded files kept around, the least recently used ones are evicted beyond this
+TRANSCODE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+
+def _cache_folder() -> str:
+    folder = cache_path("transcodes")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def transcode_key(source, format, codec, parameters, backend, analysis) -> str:
+    """
+    Cache key of a conversion, the content hash of the source plus everything that changes the output.
+
+    Args:
+        source: Path of the file to convert
+        format: Output format, eg "ogg"
+        codec: Audio encoder, None for the format's default
+        parameters: Encoder arguments that don't depend on the analysis, eg ["-q:a", "4"]
+        backend: Backend doing the conversion
+        analysis: (mono_similarity, bandwidth_db) or None, the plan itself follows from the source
+    """
+    settings = f"v{CACHE_VERSION}:{format}:{codec}:{' '.join(parameters or [])}:{backend}:{analysis}"
+    return f"{file_digest(source)}-{xxhash.xxh3_64_hexdigest(settings.encode())}.{format}"
+
+
+def fetch(key, target):
+    """
+    Copy a cached encode to target.
+
+    The cache entry's modification time is bumped so eviction drops it last. A copy rather
+    than a link, later steps like trim_empty rewrite the converted files in place.
+
+    Returns:
+        tuple: (found, AudioPlan or None the encode was made with)
+    """
+    entry = os.path.join(_cache_folder(), key)
+    try:
+        with open(entry + ".json", "r", encoding="utf-8") as f:
+            plan = json.load(f)
+        shutil.copyfile(entry, target)
+    except (OSError, ValueError):
+        return False, None
+    os.utime(entry)
+    return True, AudioPlan(**plan) if plan is not None else None
+
+
+def store(key, encoded, plan: AudioPlan | None):
+    """Add a finished encode to the cache, written under a temporary name so concurrent runs never see half a file."""
+    folder = _cache_folder()
+    entry = os.path.join(folder, key)
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(encoded, temp_path)
+        os.replace(temp_path, entry)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return
+    # The plan is written last, fetch only trusts entries that have one
+    with open(entry + ".json", "w", encoding="utf-8") as f:
+        json.dump(plan._asdict() if plan is not None else None, f)
+
+
+def cached_transcode(source, target, key_parts, convert, use_cache=True):
+    """
+    Run convert() unless an encode of the same source with the same settings is cached.
+
+    Args:
+        source: Path of the file to convert
+        target: Path the converted file is written to
+        key_parts: (format, codec, parameters, backend, analysis) for transcode_key
+        convert: Callback doing the actual conversion to target, returns the AudioPlan used or None
+        use_cache: Set to False to always convert and leave the cache alone
+
+    Returns:
+        tuple: (AudioPlan or None, True if the encode came from the cache)
+    """
+    if not use_cache:
+        return convert(), False
+
+    key = transcode_key(source, *key_parts)
+    found, plan = fetch(key, target)
+    if found:
+        return plan, True
+
+    plan = convert()
+    store(key, target, plan)
+    return plan, False
+
+
+def evict(max_bytes=TRANSCODE_CACHE_MAX_BYTES) -> int:
+    """
+    Remove the least recently used encodes until the cache fits in max_bytes.
+
+    Returns:
+        int: Number of evicted encodes
+    """
+    entries = []
+    total = 0
+    with os.scandir(_cache_folder()) as scan:
+        for entry in scan:
+            if entry.name.endswith(".json") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for stale in (path + ".json", path):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+        total -= size
+        evicted += 1
+    return evicted
@@ -1,7 +1,8 @@
 import os
 import time
-from pydub import AudioSegment, silence
+from pydub import AudioSegment
 from utils.formatting import format_size, format_percentage
+from sound_compression.tail_silence import wav_tail_silence, segment_tail_silence
 
 
 def trim_single_audio_file(input_file, silence_thresh=-55, min_silence_len=50, fade_duration=200):
@@ -21,35 +22,34 @@ def trim_single_audio_file(input_file, silence_thresh=-55, min_silence_len=50, f
         # Get original file size
         original_size = os.path.getsize(input_file)
         
-        # Determine file format and load audio file
+        # Determine file format
         file_ext = os.path.splitext(input_file)[1].lower()
         if file_ext == '.wav':
-            audio = AudioSegment.from_wav(input_file)
             export_format = "wav"
         elif file_ext == '.mp3':
-            audio = AudioSegment.from_mp3(input_file)
             export_format = "mp3"
         elif file_ext == '.ogg':
-            audio = AudioSegment.from_ogg(input_file)
             export_format = "ogg"
         else:
             return False, f"Unsupported file format: {file_ext}", 0
-        original_duration = len(audio)
 
-        # Detect non-silent chunks
-        non_silence_ranges = silence.detect_nonsilent(audio, 
-                                                      min_silence_len=min_silence_len, 
-                                                      silence_thresh=silence_thresh)
+        # Find where the trailing silence starts, WAVs only get their tail read
+        audio = None
+        detected = wav_tail_silence(input_file, silence_thresh, min_silence_len) if file_ext == '.wav' else None
+        if detected is None:
+            audio = AudioSegment.from_file(input_file, format=export_format)
+            detected = segment_tail_silence(audio, silence_thresh, min_silence_len)
+        end_trim, original_duration = detected
 
-        if non_silence_ranges:
-            # Get the last non-silent segment (only trim from end)
-            end_trim = non_silence_ranges[-1][1]
-            
+        if end_trim > 0:
             # Check if any trimming is needed from the end
             end_silence = original_duration - end_trim
             if end_silence <= min_silence_len:
                 return False, f"No significant silence to trim from end ({end_silence}ms)", 0
             
+            if audio is None:
+                audio = AudioSegment.from_wav(input_file)
+
             # Only trim from the end, keep the start intact
             trimmed_audio = audio[0:end_trim]
             
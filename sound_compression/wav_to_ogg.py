@@ -1,89 +1,145 @@
 import pydub
 import os
-import re
-from wavinfo import WavInfoReader
+import struct
 from utils.formatting import format_size, format_percentage
+from utils.journal import OperationJournal
+from utils.parallel import run_parallel
+from utils.rewrite import rewrite_references
+from sound_compression.ffmpeg import transcode, DEFAULT_BACKEND
+from sound_compression.riff import scan_wav
+from sound_compression.analysis import plan_conversion, DEFAULT_MONO_SIMILARITY, DEFAULT_BANDWIDTH_DB
+from sound_compression.transcode_cache import cached_transcode, evict
 
 # Requires ffmpeg to be installed and added to PATH
 # https://github.com/jiaaro/pydub?tab=readme-ov-file#getting-ffmpeg-set-up
 
-def wav_to_ogg(folder, progress_callback=None):
+def _export_ogg(filepath, backend=DEFAULT_BACKEND, analysis=None, use_cache=True):
+    """Encode a single WAV next to itself as OGG, runs on the transcode pool."""
+    new_filepath = filepath.replace(".wav", ".ogg")
+
+    def convert():
+        plan = plan_conversion(filepath, analysis)
+        parameters = ["-q:a", "4"] + (plan.ffmpeg_parameters() if plan is not None else [])
+        if backend == "ffmpeg":
+            transcode(filepath, new_filepath, "ogg", codec="libvorbis", parameters=parameters)
+        else:
+            sound = pydub.AudioSegment.from_wav(filepath)
+            sound.export(new_filepath, format="ogg", codec="libvorbis", parameters=parameters)
+        return plan
+
+    try:
+        plan, cached = cached_transcode(filepath, new_filepath, ("ogg", "libvorbis", ["-q:a", "4"], backend, analysis),
+                                        convert, use_cache)
+    except Exception as e:
+        return filepath, None, e, None, False
+    return filepath, new_filepath, None, plan, cached
+
+def wav_to_ogg(folder, progress_callback=None, resume=True, workers=1, backend=DEFAULT_BACKEND,
+               analyze=False, mono_similarity=DEFAULT_MONO_SIMILARITY, bandwidth_db=DEFAULT_BANDWIDTH_DB, use_cache=True):
+    """
+    Convert all WAV files in the folder to OGG and update the lua/txt/json files referencing them.
+    Files with cues or loops are skipped, they would lose them.
+
+    Args:
+        folder: Path to the addon folder
+        progress_callback: Optional callback(current, total) for progress updates
+        resume: Continue an interrupted run instead of starting over
+        workers: Number of concurrent encoders
+        backend: "ffmpeg" to stream the files through ffmpeg, "pydub" to decode them in Python first
+        analyze: Downmix identical stereo channels and lower the sample rate of band-limited files
+        mono_similarity: Channel similarity (0-1) from which stereo is downmixed
+        bandwidth_db: Level relative to the loudest frequency that still counts as content
+        use_cache: Reuse earlier encodes of identical WAVs with the same settings instead of encoding them again
+    """
     replaced_files = {}
     old_size = 0
     new_size = 0
     replace_count = 0
 
-    # First pass: count WAV files
-    wav_files = []
-    if progress_callback:
+    # Conversions finished by an earlier run that got interrupted
+    journal = OperationJournal(folder, "wav_to_ogg", resume)
+    try:
+        for source_path, entry in list(journal.items()):
+            target_path = os.path.join(os.path.dirname(source_path), entry["new_name"])
+            if not os.path.exists(target_path):
+                journal.forget(source_path)
+                continue
+            if os.path.exists(source_path):
+                # Stopped between writing the new file and removing the old one
+                os.remove(source_path)
+            old_size += entry["old_size"]
+            new_size += entry["new_size"]
+            replace_count += 1
+            replaced_files[entry["old_name"]] = entry["new_name"]
+        if replace_count > 0:
+            print("Resuming, skipping", replace_count, "files converted by the previous run.")
+
+        # Cue and loop checks only read the chunk headers, do them up front so the pool only gets real conversions
+        wav_files = []
         for path, subdirs, files in os.walk(folder):
             for name in files:
-                if name.split(".")[-1] == "wav":
-                    wav_files.append(os.path.join(path, name))
-        total_wavs = len(wav_files)
-        processed = 0
-
-    for path, subdirs, files in os.walk(folder):
-        for name in files:
-            filepath = os.path.join(path, name)
-            filetype = name.split(".")[-1]
-            if filetype == "wav":
-                if progress_callback:
-                    processed += 1
-                    progress_callback(processed, total_wavs)
-                
-                wav_info = WavInfoReader(filepath)
-                if wav_info.cues != None and len(wav_info.cues.cues) > 0:
-                    print("File", filepath, "contains cues skipping.")
-                    continue
-
-                if wav_info.smpl != None and len(wav_info.smpl.sample_loops) > 0:
-                    print("File", filepath, "contains loops skipping.")
-                    continue
-
-                try:
-                    old_size += os.path.getsize(filepath)
-                    sound = pydub.AudioSegment.from_wav(filepath)
-
-                    new_filepath = filepath.replace(".wav", ".ogg")
-                    sound.export(new_filepath, format="ogg", codec="libvorbis", parameters=["-q:a", "4"])
-                    new_size += os.path.getsize(new_filepath)
-
-                    file_name = os.path.basename(filepath)
-                    replace_count += 1
-                    replaced_files[file_name] = file_name.replace(".wav", ".ogg")
-                    os.remove(filepath)
-
-                    print("Converted", filepath, "to ogg successfully.")
-                except Exception as e:
-                    print(f"Failed to convert {filepath}: {e}")
-                    continue
-
-    for path, subdirs, files in os.walk(folder):
-        for name in files:
-            filepath = os.path.join(path, name)
-            filetype = name.split(".")[-1]
-            if filetype == "lua" or filetype == "txt" or filetype == "json":
-                with open(filepath, "r", encoding="utf-8") as f:
-                    contents = f.read()
-                
-                replaced = False
-                for old, new in replaced_files.items():
-                    pattern = re.escape(old)
-                    new_contents = re.sub(pattern, new, contents, flags=re.IGNORECASE)
-                    if new_contents != contents:
-                        replaced = True
-                    contents = new_contents
-
-                if not replaced:
-                    continue
-
-                with open(filepath, "w", encoding="utf-8") as f:
-                    f.write(contents)
-                print("Replaced", filepath, "successfully.")
+                filepath = os.path.join(path, name)
+                filetype = name.split(".")[-1]
+                if filetype == "wav":
+                    try:
+                        wav_info = scan_wav(filepath)
+                    except (OSError, ValueError, struct.error) as e:
+                        print(f"Skipping unreadable WAV file: {filepath} - Error: {e}")
+                        continue
+
+                    if wav_info.has_cues:
+                        print("File", filepath, "contains cues skipping.")
+                        continue
+
+                    if wav_info.has_loops:
+                        print("File", filepath, "contains loops skipping.")
+                        continue
+
+                    wav_files.append(filepath)
+
+        # Encoders run concurrently, the results are applied in walk order
+        analysis = (mono_similarity, bandwidth_db) if analyze else None
+        items = [(filepath, backend, analysis, use_cache) for filepath in wav_files]
+        downmix_count = 0
+        resample_count = 0
+        cached_count = 0
+        for filepath, new_filepath, error, plan, cached in run_parallel(_export_ogg, items, workers, progress_callback, threads=True, ordered=True):
+            if error is not None:
+                print(f"Failed to convert {filepath}: {error}")
+                continue
+
+            file_name = os.path.basename(filepath)
+            file_old_size = os.path.getsize(filepath)
+            file_new_size = os.path.getsize(new_filepath)
+            old_size += file_old_size
+            new_size += file_new_size
+            replace_count += 1
+            replaced_files[file_name] = file_name.replace(".wav", ".ogg")
+            journal.record(filepath, old_name=file_name, new_name=replaced_files[file_name],
+                           old_size=file_old_size, new_size=file_new_size)
+            os.remove(filepath)
+
+            print("Converted", filepath, "to ogg successfully." if not cached else "to ogg from the transcode cache.")
+            cached_count += cached
+            if plan is not None:
+                print("  ", plan.describe())
+                downmix_count += plan.downmix
+                resample_count += plan.resample
+
+        rewrite_references(folder, replaced_files)
+        if use_cache:
+            evict()
+
+        journal.finish()
+    finally:
+        journal.close()
 
     print("="*60)
     print("Replaced", replace_count, "files.")
+    if use_cache:
+        print("Reused", cached_count, "encodes from the transcode cache.")
+    if analyze:
+        print("Downmixed", downmix_count, "files to mono, lowered the sample rate of", resample_count, "files.")
     if replace_count == 0:
         print("No files were replaced.")
     else:
@@ -1,7 +1,5 @@
 import os
-from srctools.mdl import Model
-from srctools.vmt import Material
-from srctools.filesys import RawFileSystem
+from utils.depgraph import DependencyGraph
 
 model_formats = [
     ".mdl",
@@ -15,75 +13,33 @@ model_formats = [
     ".xbox.vtx",
 ]
 
-def unused_content(path, remove=False):
+def unused_content(path, remove=False, workers=1):
+    """
+    Find (and optionally remove) models that no lua file references, and the materials and textures only they use.
+
+    Args:
+        path: Path to the addon folder
+        remove: Remove the unused files instead of only listing them
+        workers: Number of worker processes parsing the files that changed since the last scan
+    """
     unused_sizes = 0
     unused_count = 0
-    fs = RawFileSystem(path)
-
-    # Find all the models in the filesystem
-    all_models = []
-    all_model_vmts = {}
-    vmt_used_count = {}
-    vmf_used_count = {}
-    for file in fs.walk_folder(''):
-        if file.path.endswith('.mdl'):
-            all_models.append(file.path)
-
-            all_model_vmts[file.path] = all_model_vmts.get(file.path, [])
-            model = Model(fs, fs[file.path])
-            for tex in model.iter_textures():
-                # append path relative to the input path
-                all_model_vmts[file.path].append(tex)
-                vmt_used_count[tex] = vmt_used_count.get(tex, 0) + 1
 
-    # Find all the vtfs of the all_model_vmts vmts
-    all_model_vtfs = {}
-    all_vtfs = []
-    for model, vmts in all_model_vmts.items():
-        for vmt_path in vmts:
-            vmt_full_path = os.path.join(path, vmt_path)
-            if os.path.exists(vmt_full_path):
-                with open(vmt_full_path, "r", encoding="utf-8") as f:
-                    vmt = Material.parse(f, filename=vmt_path)
-                for vmtfield in vmt.items():
-                    if vmtfield[0].startswith("$basetexture"):
-                        vtf = os.path.normpath(vmtfield[1])
-                        all_model_vtfs[model] = all_model_vtfs.get(model, [])
-                        all_model_vtfs[model].append(vtf)
-                        all_vtfs.append(vtf)
-                        vmf_used_count[vtf] = vmf_used_count.get(vtf, 0) + 1
+    graph = DependencyGraph(path, workers)
+    try:
+        # Lua is the only content known to be used, everything it reaches directly or through other files stays
+        used = graph.reachable(file for file in graph.files if file.endswith(".lua"))
+        unused_models = sorted(file for file in graph.files if file.endswith(".mdl") and file not in used)
+        # What only the unused models need
+        model_content = graph.reachable(unused_models) - used
 
-    # Find all the models used in lua files
-    all_lua_used_models = []
-    for file in fs.walk_folder('lua'):
-        if file.path.endswith('.lua'):
-            lua_file_path = os.path.join(path, file.path)
-            if os.path.exists(lua_file_path):
-                with open(lua_file_path, "r", encoding="utf-8") as f:
-                    lua_contents = f.read()
-                    lua_contents = lua_contents.lower()
-                    for model in all_models:
-                        if model in lua_contents:
-                            all_lua_used_models.append(model)
-
-    # print not used models
-    print("Unused models:")
-    unused_models = []
-    for model in all_models:
-        if model not in all_lua_used_models:
-            no_ext_model = os.path.splitext(model)[0]
+        # print not used models
+        print("Unused models:")
+        for model in unused_models:
+            no_ext_model = graph.files[model][:-len(".mdl")]
             for ext in model_formats:
                 format_path = os.path.join(path, no_ext_model + ext)
                 if os.path.exists(format_path):
-                    if ext == ".mdl":
-                        unused_models.append(model)
-
-                        for vmt in all_model_vmts[model]:
-                            vmt_used_count[vmt] -= 1
-
-                        for vtf in all_model_vtfs.get(model, []):
-                            vmf_used_count[vtf] -= 1
-
                     print("Found unused file:", format_path)
                     unused_sizes += os.path.getsize(format_path)
                     unused_count += 1
@@ -91,31 +47,20 @@ def unused_content(path, remove=False):
                         os.remove(format_path)
                         print("Removed", format_path)
 
-    # Find all the vmts that no longer get used
-    unused_vmts = []
-    for vmt_used in vmt_used_count:
-        if vmt_used_count[vmt_used] == 0:
-            vmt_file_path = os.path.join(path, vmt_used)
-            if os.path.exists(vmt_file_path):
-                unused_vmts.append(vmt_used)
-                unused_sizes += os.path.getsize(vmt_file_path)
-                unused_count += 1
-                print("Found unused file:", vmt_file_path)
-                if remove:
-                    os.remove(vmt_file_path)
-                    print("Removed", vmt_used)
-    
-    unused_vtfs = []
-    for vtf_used in vmf_used_count:
-        if vmf_used_count[vtf_used] == 0:
-            vtf_used = "materials/" + vtf_used + ".vtf"
-            if os.path.exists(os.path.join(path, vtf_used)):
-                unused_vtfs.append(vtf_used)
-                unused_sizes += os.path.getsize(os.path.join(path, vtf_used))
-                unused_count += 1
-                print("Found unused file:", os.path.join(path, vtf_used))
-                if remove:
-                    os.remove(os.path.join(path, vtf_used))
-                    print("Removed", vtf_used)
-            
+        # Find all the vmts and vtfs that no longer get used
+        for filetype in (".vmt", ".vtf"):
+            for file in sorted(model_content):
+                if not file.endswith(filetype):
+                    continue
+                file_path = os.path.join(path, graph.files[file])
+                if os.path.exists(file_path):
+                    unused_sizes += os.path.getsize(file_path)
+                    unused_count += 1
+                    print("Found unused file:", file_path)
+                    if remove:
+                        os.remove(file_path)
+                        print("Removed", graph.files[file])
+    finally:
+        graph.close()
+
     return unused_sizes, unused_count
@@ -1,40 +1,232 @@
 import os
 import xxhash
 from utils.formatting import format_size
+from utils.parallel import run_parallel
+from utils import hashcache
+from utils.rewrite import rewrite_references, referenced_paths, path_key, is_path_token, REWRITE_FILETYPES
 
+# Duplicates that dedupe mode merges, by the folder the game looks them up in.
+# Other files, like models, are mostly referenced from places that can't be rewritten.
+DEDUPE_FILETYPES = {
+    "materials": (".vtf", ".png", ".jpg"),
+    "sound": (".wav", ".mp3", ".ogg"),
+}
+# Files whose references to merged duplicates are rewritten
+DEDUPE_REWRITE_FILETYPES = REWRITE_FILETYPES + ("vmt",)
+# Binary files that can name textures and sounds, models play sounds from animation events,
+# maps name sounds and pack their own materials, particles and scenes name materials and sounds
+UNREWRITABLE_FILETYPES = (".mdl", ".bsp", ".pcf", ".vcd")
 
-def find_duplicates(folder: str, remove: bool = False, progress_callback=None):
-    hash_map = {}
-    total_files = 0
-    for root, dirs, files in os.walk(folder):
-        dirs[:] = [d for d in dirs if d != '.git']
-        total_files += len(files)
-    
-    processed = 0
+
+def scan_files(folder: str):
+    """
+    Yield (path, size) of every file below folder, skipping .git folders.
+
+    Uses the stat results os.scandir already has, in the same order os.walk visits the files.
+    """
+    subdirs = []
+    try:
+        entries = list(os.scandir(folder))
+    except OSError as e:
+        print(f"Error scanning {folder}: {e}")
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name != '.git':
+                    subdirs.append(entry.path)
+            elif entry.is_file():
+                yield entry.path, entry.stat().st_size
+        except OSError as e:
+            print(f"Error reading {entry.path}: {e}")
+    for subdir in subdirs:
+        yield from scan_files(subdir)
+
+
+def _hash_file(hash_function, file_path, *args):
+    try:
+        return file_path, hash_function(file_path, *args), None
+    except (OSError, IOError) as e:
+        return file_path, None, e
+
+
+def _hash_files(column, hash_function, items, workers, progress_callback, use_cache):
+    """
+    Digests of the files in items, argument tuples for hash_function, from the cache or hashed on the thread pool.
+
+    Returns:
+        dict: file path -> digest, files that couldn't be read are missing
+    """
+    digests = hashcache.lookup([args[0] for args in items], column) if use_cache else {}
+    pending = [(hash_function, *args) for args in items if args[0] not in digests]
+    hashed = {}
+    for file_path, digest, error in run_parallel(_hash_file, pending, workers, progress_callback, threads=True):
+        if error is not None:
+            print(f"Error hashing {file_path}: {error}")
+            continue
+        hashed[file_path] = digest
+    if use_cache:
+        hashcache.store(hashed, column)
+    digests.update(hashed)
+    return digests
+
+
+def reference_forms(rel_path: str) -> tuple[list[str], list[str]]:
+    """
+    Ways a file can be referenced, with and without its extension.
+
+    Eg "materials/a/x.vtf" and "a/x.vtf", and for VTFs also "materials/a/x" and "a/x" as VMTs
+    leave the extension out.
+
+    Returns:
+        tuple: (forms with the extension, forms without it)
+    """
+    top, rest = rel_path.split("/", 1)
+    bare_forms = []
+    if rest.lower().endswith(".vtf"):
+        bare_forms = [f"{top}/{rest[:-4]}", rest[:-4]]
+    return [rel_path, rest], bare_forms
+
+
+def referenced_forms(file_paths, keys, filetypes) -> set[str]:
+    """
+    Path keys in keys that the files of the given types refer to, see referenced_paths.
+
+    Also finds references the rewrite doesn't touch, like "a/x" at the end of "b/a/x".
+    """
+    found = set()
+    if not keys:
+        return found
+    for file_path in file_paths:
+        if not file_path.lower().endswith(filetypes):
+            continue
+        try:
+            with open(file_path, "rb") as f:
+                found |= referenced_paths(f.read(), keys)
+        except OSError as e:
+            print(f"Error reading {file_path}: {e}")
+    return found
+
+
+def dedupe_references(folder: str, duplicate_groups) -> list[str]:
+    """
+    Point references to duplicates at one canonical copy per group.
+
+    The first copy of each group stays, only files in DEDUPE_FILETYPES are merged. Whole paths
+    with an extension are rewritten in VMT and lua/txt/json files, VTF names without one only in
+    VMTs, anywhere else "a/x" could just as well be the material a/x.vmt.
+
+    A copy is left in place when a VMT has the same name as a VTF copy, when a model, map,
+    particle or scene names it, or when a VMT or lua/txt/json file still names it after the
+    rewrite. Paths Lua builds from pieces can't be found at all.
+
+    Args:
+        folder: Path to the addon folder
+        duplicate_groups: Lists of paths with identical contents
+
+    Returns:
+        list: Paths of the copies that nothing refers to anymore and can be removed
+    """
+    file_paths = [file_path for file_path, _ in scan_files(folder)]
+    materials = {
+        os.path.relpath(file_path, folder).replace(os.sep, "/").lower()
+        for file_path in file_paths if file_path.lower().endswith(".vmt")
+    }
+
+    merges = []
+    for paths in duplicate_groups:
+        # Only copies the game looks up the same way can replace each other
+        canonical = {}
+        for path in paths:
+            rel_path = os.path.relpath(path, folder).replace(os.sep, "/")
+            top = rel_path.split("/", 1)[0].lower()
+            filetype = os.path.splitext(rel_path)[1].lower()
+            if "/" not in rel_path or filetype not in DEDUPE_FILETYPES.get(top, ()):
+                continue
+            kept = canonical.setdefault((top, filetype), rel_path)
+            if kept == rel_path:
+                continue
+            if not is_path_token(rel_path):
+                print(f"Keeping {path}, references to a name with spaces or other symbols can't be found reliably")
+                continue
+            if filetype == ".vtf" and rel_path[:-4].lower() + ".vmt" in materials:
+                print(f"Keeping {path}, a material has the same name")
+                continue
+            merges.append((path, reference_forms(rel_path), reference_forms(kept)))
+
+    # Binary files can't be rewritten at all
+    unreachable = referenced_forms(
+        file_paths, {path_key(form) for _, (forms, bare_forms), _ in merges for form in forms + bare_forms},
+        UNREWRITABLE_FILETYPES,
+    )
+
+    replacements = {}
+    texture_replacements = {}
+    rewritten = []
+    for path, (forms, bare_forms), (kept_forms, kept_bare_forms) in merges:
+        if any(path_key(form) in unreachable for form in forms + bare_forms):
+            print(f"Keeping {path}, it's referenced from a file that can't be rewritten")
+            continue
+        replacements.update(zip(forms, kept_forms))
+        texture_replacements.update(zip(bare_forms, kept_bare_forms))
+        rewritten.append((path, forms + bare_forms))
+
+    rewritten_count = rewrite_references(folder, replacements, REWRITE_FILETYPES, boundaries=True)
+    rewritten_count += rewrite_references(folder, {**replacements, **texture_replacements}, ("vmt",), boundaries=True)
+    print(f"Rewrote references in {rewritten_count} files.")
+
+    # Anything still naming a copy is a reference the rewrite couldn't handle, eg a VTF named without its extension in Lua
+    remaining = referenced_forms(
+        file_paths, {path_key(form) for _, forms in rewritten for form in forms},
+        tuple("." + filetype for filetype in DEDUPE_REWRITE_FILETYPES),
+    )
+    redundant = []
+    for path, forms in rewritten:
+        if any(path_key(form) in remaining for form in forms):
+            print(f"Keeping {path}, it's still referenced in a form that couldn't be rewritten")
+            continue
+        redundant.append(path)
+    return redundant
+
+
+def find_duplicates(folder: str, remove: bool = False, progress_callback=None, workers: int = 1, use_cache: bool = True,
+                    dedupe: bool = False):
+    """
+    Find (and optionally remove) files with identical contents, the first occurrence is kept.
+
+    Only files sharing their size with another file are read at all. Those get a quick hash
+    of their first and last 4KB, files that still collide are hashed completely.
+
+    Args:
+        folder: Path to the addon folder
+        remove: Remove every copy but the first
+        progress_callback: Optional callback(current, total), runs once for the quick and once for the full hashes
+        workers: Number of threads hashing files, the work is mostly waiting on the disk
+        use_cache: Reuse the digests of files that didn't change since an earlier scan
+        dedupe: With remove, rewrite references to the removed copies first, see dedupe_references
+
+    Returns:
+        tuple: (size, count) of the duplicates, in dedupe mode of the copies that were removed
+    """
+    size_map = {}
+    for file_path, file_size in scan_files(folder):
+        size_map.setdefault(file_size, []).append((file_path, file_size))
+
+    # A file with a unique size can't have a duplicate
+    candidates = [(file_path, file_size) for paths in size_map.values() if len(paths) > 1 for file_path, file_size in paths]
+    quick_hashes = _hash_files("quick", calculate_quick_hash, candidates, workers, progress_callback, use_cache)
     quick_hash_map = {}
-    for root, dirs, files in os.walk(folder):
-        dirs[:] = [d for d in dirs if d != '.git']
-        for filename in files:
-            file_path = os.path.join(root, filename)
-            try:
-                quick_hash = calculate_quick_hash(file_path)
-                quick_hash_map.setdefault(quick_hash, []).append(file_path)
-            except (OSError, IOError) as e:
-                print(f"Error hashing {file_path}: {e}")
-            
-            processed += 1
-            if progress_callback:
-                progress_callback(processed, total_files)
-    
-    for quick_hash, file_paths in quick_hash_map.items():
-        if len(file_paths) > 1:
-            for file_path in file_paths:
-                try:
-                    file_hash = calculate_file_hash(file_path)
-                    hash_map.setdefault(file_hash, []).append(file_path)
-                except (OSError, IOError) as e:
-                    print(f"Error hashing {file_path}: {e}")
-    
+    for file_path, file_size in candidates:
+        if file_path in quick_hashes:
+            quick_hash_map.setdefault(quick_hashes[file_path], []).append(file_path)
+
+    candidates = [(file_path,) for file_paths in quick_hash_map.values() if len(file_paths) > 1 for file_path in file_paths]
+    file_hashes = _hash_files("full", calculate_file_hash, candidates, workers, progress_callback, use_cache)
+    hash_map = {}
+    for (file_path,) in candidates:
+        if file_path in file_hashes:
+            hash_map.setdefault(file_hashes[file_path], []).append(file_path)
+
     duplicate_size = 0
     duplicate_count = 0
     duplicates_found = False
@@ -62,24 +254,37 @@ def find_duplicates(folder: str, remove: bool = False, progress_callback=None):
         print(f"\nTotal duplicates: {duplicate_count} files, {format_size(duplicate_size)}")
         
         if remove:
+            duplicate_groups = [paths for paths in hash_map.values() if len(paths) > 1]
+            if dedupe:
+                to_remove = dedupe_references(folder, duplicate_groups)
+                # Copies that had to stay don't count
+                duplicate_size = 0
+                duplicate_count = len(to_remove)
+                for path in to_remove:
+                    try:
+                        duplicate_size += os.path.getsize(path)
+                    except OSError:
+                        pass
+            else:
+                to_remove = [path for paths in duplicate_groups for path in paths[1:]]
+
             removed_count = 0
-            for paths in hash_map.values():
-                if len(paths) > 1:
-                    for path in paths[1:]:
-                        try:
-                            os.remove(path)
-                            removed_count += 1
-                            print(f"Removed: {path}")
-                        except Exception as e:
-                            print(f"Error removing {path}: {e}")
+            for path in to_remove:
+                try:
+                    os.remove(path)
+                    removed_count += 1
+                    print(f"Removed: {path}")
+                except Exception as e:
+                    print(f"Error removing {path}: {e}")
             print(f"Removed {removed_count} duplicate files.")
     
     return duplicate_size, duplicate_count
 
 
-def calculate_quick_hash(file_path: str) -> str:
+def calculate_quick_hash(file_path: str, file_size: int | None = None) -> str:
     """Quick hash using file size and first/last 4KB of file."""
-    file_size = os.path.getsize(file_path)
+    if file_size is None:
+        file_size = os.path.getsize(file_path)
     with open(file_path, "rb") as f:
         first_bytes = f.read(4096)
         if file_size > 4096:
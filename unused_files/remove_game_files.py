@@ -1,9 +1,10 @@
 import os
-import xxhash
+import zlib
 from utils.vpk import get_vpk_files
 from utils.formatting import format_size
+from utils import hashcache
 
-def remove_game_files(folder, gamefolder, remove=True, remove_different_content=False):
+def remove_game_files(folder, gamefolder, remove=True, remove_different_content=False, use_cache=True):
     """
     Remove files that exist in the game's VPK files from the addon folder.
 
@@ -11,6 +12,7 @@ def remove_game_files(folder, gamefolder, remove=True, remove_different_content=
         folder: Path to the addon folder to clean
         gamefolder: Path to the game folder containing VPK files
         remove: If True, actually remove files. If False, just report what would be removed.
+        use_cache: Reuse the hashes of addon files that didn't change since an earlier run
     """
     print("Removing game files...")
 
@@ -38,26 +40,19 @@ def remove_game_files(folder, gamefolder, remove=True, remove_different_content=
             # Check if this file exists in any VPK
             if rel_path in vpk_files:
                 if not remove_different_content:
-                    vpk = vpk_files[rel_path]
-                    vpk_content = vpk.read_entry(rel_path)
-                    vpk_content_len = len(vpk_content)
+                    vpk_entry = vpk_files[rel_path]
 
                     addon_file_size = os.path.getsize(file_path)
-                    if vpk_content_len != addon_file_size:
-                        print(f"✗ File size mismatch {addon_file_size}/{vpk_content_len} for {rel_path}, skipping removal.")
+                    if vpk_entry.length != addon_file_size:
+                        print(f"✗ File size mismatch {addon_file_size}/{vpk_entry.length} for {rel_path}, skipping removal.")
                         continue
 
-                    # Comapre xxhashes of both files to ensure they are identical
-                    hasher = xxhash.xxh64()
-                    with open(file_path, "rb") as f:
-                        while True:
-                            data = f.read(65536)
-                            if not data:
-                                break
-                            hasher.update(data)
-
-                    addon_file_hash = hasher.digest()
-                    vpk_file_hash = xxhash.xxh64(vpk_content).digest()
+                    # The VPK directory stores the CRC32 of every file, so only the addon file has to be read
+                    if use_cache:
+                        addon_file_hash = hashcache.cached_hash(file_path, "crc32", calculate_crc32)
+                    else:
+                        addon_file_hash = calculate_crc32(file_path)
+                    vpk_file_hash = f"{vpk_entry.crc32:08x}"
                     if addon_file_hash != vpk_file_hash:
                         print(f"✗ File hash mismatch for {rel_path}, skipping removal.")
                         continue
@@ -100,3 +95,12 @@ def remove_game_files(folder, gamefolder, remove=True, remove_different_content=
     else:
         print(f"Freed up {format_size(removed_size)} of space")
     print("="*60)
+
+
+def calculate_crc32(file_path: str, chunk_size: int = 131072) -> str:
+    """CRC32 of a file as 8 hex digits, the checksum VPK directories store for their files."""
+    crc = 0
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            crc = zlib.crc32(chunk, crc)
+    return f"{crc:08x}"
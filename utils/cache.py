@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import xxhash
+
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache")
+
+
+def cache_path(name: str) -> str:
+    """Path of a file inside the local cache folder, creates the folder if needed."""
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    return os.path.join(CACHE_FOLDER, name)
+
+
+def open_cache_db(name: str, schema: str) -> sqlite3.Connection:
+    """
+    Open (and create if needed) a SQLite database in the cache folder.
+
+    Args:
+        name: File name of the database
+        schema: SQL script with CREATE ... IF NOT EXISTS statements for the tables
+    """
+    # Every UI task runs on a new thread, the connection is shared between them but never used concurrently
+    connection = sqlite3.connect(cache_path(name), timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(schema)
+    return connection
+
+
+def file_digest(file_path: str, chunk_size: int = 1048576) -> str:
+    """Content hash used to address cache entries, xxh3 128 bit over the whole file."""
+    hasher = xxhash.xxh3_128()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
@@ -0,0 +1,249 @@
+import os
+import re
+from collections import defaultdict
+from pathlib import PurePosixPath
+from srctools.filesys import RawFileSystem
+from srctools.mdl import Model
+from srctools.vmt import Material
+from utils.cache import open_cache_db
+from utils.parallel import run_parallel
+
+# Bump when the parsers change so every file is parsed again
+GRAPH_VERSION = 1
+
+# Files that can reference other files
+PARSED_FILETYPES = (".mdl", ".vmt", ".lua")
+# Files that make up a model next to its .mdl
+MODEL_PARTS = (".vvd", ".phy", ".vtx", ".ani", ".sw.vtx", ".dx80.vtx", ".dx90.vtx", ".xbox.vtx", ".360.vtx")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (root, path)
+);
+CREATE TABLE IF NOT EXISTS edges (
+    root TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    kind TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS edges_source ON edges (root, source);
+"""
+
+# String literals, "..." '...' and [[...]]
+_LUA_STRING = re.compile(r'"((?:[^"\\\n]|\\.)*)"|\'((?:[^\'\\\n]|\\.)*)\'|\[(=*)\[(.*?)\]\3\]', re.DOTALL)
+# Anything that could be a file path
+_LUA_PATH = re.compile(r"^[\w\-. /\\]+$")
+# Text in front of a ".mdl", wherever it is in the file, comments included
+_LUA_MODEL = re.compile(r"[^\s\"'()\[\]{},;=]*\.mdl")
+
+
+def node(path: str) -> str:
+    """Graph node of a path relative to the content folder, the game looks files up case-insensitively."""
+    return path.replace("\\", "/").strip("/").lower()
+
+
+def referenced_models(contents, model_set, model_lengths):
+    """
+    Find the model paths that occur anywhere in contents, in a single scan.
+
+    Every model path ends in ".mdl", so only the text in front of each ".mdl" in contents
+    has to be looked up, once for every distinct path length. Gives the same result as
+    checking `model in contents` for every model.
+
+    Args:
+        contents: Text to search
+        model_set: Set of model paths
+        model_lengths: Distinct lengths of the paths in model_set
+    """
+    found = set()
+    end = contents.find(".mdl")
+    while end != -1:
+        end += 4
+        for length in model_lengths:
+            if length > end:
+                break
+            candidate = contents[end - length:end]
+            if candidate in model_set:
+                found.add(candidate)
+        end = contents.find(".mdl", end)
+    return found
+
+
+def _model_edges(fs, path):
+    model = Model(fs, fs[path])
+    edges = []
+    # Every cdmaterials folder a texture could be in, the ones that don't exist never match a file
+    for tex in {tex for texgroup in model.skins for tex in texgroup}:
+        for folder in model.cdmaterials:
+            edges.append((str(PurePosixPath("materials", folder, tex).with_suffix(".vmt")), "texture"))
+    stem = path[:-len(".mdl")]
+    edges.extend((stem + ext, "model_part") for ext in MODEL_PARTS)
+    return edges
+
+
+def _material_targets(value):
+    value = node(value)
+    if not value:
+        return []
+    if value.startswith("materials/"):
+        value = value[len("materials/"):]
+    if os.path.splitext(value)[1]:
+        return ["materials/" + value]
+    return ["materials/" + value + ".vtf", "materials/" + value + ".vmt"]
+
+
+def _vmt_edges(fs, path):
+    with fs[path].open_str() as f:
+        material = Material.parse(f, filename=path)
+
+    # Any parameter could name a texture ($basetexture, $bumpmap, $envmapmask, $detail, ...) or
+    # material ($bottommaterial, include), values that aren't paths never match a file
+    values = [value for _, value in material.items()]
+    for block in material.blocks:
+        values.extend(kv.value for kv in block.iter_tree())
+    return [(target, "material") for value in values for target in _material_targets(value)]
+
+
+def _lua_edges(fs, path):
+    with fs[path].open_str() as f:
+        contents = f.read().lower()
+
+    edges = []
+    for match in _LUA_STRING.finditer(contents):
+        literal = next(group for group in (match.group(1), match.group(2), match.group(4)) if group is not None)
+        if not _LUA_PATH.match(literal):
+            continue
+        literal = node(literal)
+        # Model("models/x.mdl"), Material("x/y"), surface.PlaySound("x/y.wav"), include("x.lua"), ...
+        edges.append((literal, "lua"))
+        edges.extend((target, "lua") for target in _material_targets(literal))
+        edges.append(("sound/" + literal, "lua"))
+        edges.append(("lua/" + literal, "lua"))
+    # Models count as used when their path shows up anywhere, matched against the models in DependencyGraph._load
+    edges.extend((token, "lua_model") for token in set(_LUA_MODEL.findall(contents)))
+    return edges
+
+
+def parse_file(root, path):
+    """Parse a single file and return (path, [(target, kind)]), runs on the process pool."""
+    fs = RawFileSystem(root)
+    try:
+        if path.lower().endswith(".mdl"):
+            edges = _model_edges(fs, path)
+        elif path.lower().endswith(".vmt"):
+            edges = _vmt_edges(fs, path)
+        else:
+            edges = _lua_edges(fs, path)
+    except Exception as e:
+        print(f"Couldn't parse {path}, it won't reference anything: {e}")
+        edges = []
+    return path, [(node(target), kind) for target, kind in edges]
+
+
+class DependencyGraph:
+    """
+    Stored graph of which files of a content folder reference which other files.
+
+    Models reference their VMTs and model parts, VMTs the textures and materials in their
+    parameters, Lua files the paths in their string literals. The graph is kept in the cache
+    folder and only files whose size or mtime changed are parsed again, so building it for
+    a folder that was scanned before only costs a walk.
+
+    Nodes are lowercase paths relative to the folder with forward slashes, see node().
+    """
+
+    def __init__(self, folder: str, workers: int = 1, progress_callback=None):
+        self.folder = os.path.abspath(folder)
+        self._root = os.path.normcase(self.folder)
+        self._connection = open_cache_db("dependency_graph.db", _SCHEMA)
+        # node -> path as found on disk, for every file in the folder
+        self.files = {}
+        self._edges = defaultdict(list)
+        self.update(workers, progress_callback)
+
+    def update(self, workers: int = 1, progress_callback=None):
+        """
+        Bring the stored graph up to date with the folder.
+
+        Returns:
+            tuple: (number of files parsed again, number of files dropped from the graph)
+        """
+        self.files = {}
+        stats = {}
+        for path, subdirs, names in os.walk(self.folder):
+            for name in names:
+                full_path = os.path.join(path, name)
+                rel_path = os.path.relpath(full_path, self.folder).replace(os.sep, "/")
+                self.files[node(rel_path)] = rel_path
+                if name.lower().endswith(PARSED_FILETYPES):
+                    stat = os.stat(full_path)
+                    stats[rel_path] = (stat.st_size, stat.st_mtime_ns)
+
+        stored = {
+            path: (size, mtime, version)
+            for path, size, mtime, version in self._connection.execute(
+                "SELECT path, size, mtime, version FROM files WHERE root = ?", (self._root,)
+            )
+        }
+        changed = [path for path, stat in stats.items() if stored.get(path) != (*stat, GRAPH_VERSION)]
+        removed = [path for path in stored if path not in stats]
+
+        parsed = run_parallel(parse_file, [(self.folder, path) for path in changed], workers, progress_callback)
+        with self._connection:
+            for path in removed + changed:
+                self._connection.execute("DELETE FROM files WHERE root = ? AND path = ?", (self._root, path))
+                self._connection.execute("DELETE FROM edges WHERE root = ? AND source = ?", (self._root, node(path)))
+            for path, edges in parsed:
+                size, mtime = stats[path]
+                self._connection.execute(
+                    "INSERT INTO files (root, path, size, mtime, version) VALUES (?, ?, ?, ?, ?)",
+                    (self._root, path, size, mtime, GRAPH_VERSION),
+                )
+                self._connection.executemany(
+                    "INSERT INTO edges (root, source, target, kind) VALUES (?, ?, ?, ?)",
+                    [(self._root, node(path), target, kind) for target, kind in edges],
+                )
+
+        self._load()
+        return len(changed), len(removed)
+
+    def _load(self):
+        # Only edges to files that exist matter, most Lua string candidates are dropped here
+        self._edges = defaultdict(list)
+        model_tokens = defaultdict(set)
+        for source, target, kind in self._connection.execute(
+            "SELECT source, target, kind FROM edges WHERE root = ?", (self._root,)
+        ):
+            if kind == "lua_model":
+                model_tokens[source].add(target)
+            elif target in self.files:
+                self._edges[source].append(target)
+
+        # A model is referenced by any text ending in its path, whether it's a full string or not
+        models = {path for path in self.files if path.endswith(".mdl")}
+        model_lengths = sorted({len(model) for model in models})
+        for source, tokens in model_tokens.items():
+            self._edges[source].extend(referenced_models("\n".join(tokens), models, model_lengths))
+
+    def dependencies(self, path: str) -> list[str]:
+        """Existing files path references directly."""
+        return self._edges.get(node(path), [])
+
+    def reachable(self, roots) -> set[str]:
+        """Every existing file referenced by roots directly or indirectly, roots included."""
+        seen = {node(root) for root in roots}
+        stack = list(seen)
+        while stack:
+            for target in self._edges.get(stack.pop(), []):
+                if target not in seen:
+                    seen.add(target)
+                    stack.append(target)
+        return seen
+
+    def close(self):
+        self._connection.close()
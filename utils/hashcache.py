@@ -0,0 +1,102 @@
+import os
+from utils.cache import open_cache_db
+
+# Digests a file can have cached, each computed by the module that needs it
+HASH_COLUMNS = ("quick", "full", "crc32")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    quick TEXT,
+    full TEXT,
+    crc32 TEXT
+);
+"""
+
+_connection = None
+
+
+def _db():
+    # Only the thread driving the scan touches the cache, hashing threads just return digests
+    global _connection
+    if _connection is None:
+        _connection = open_cache_db("file_hashes.db", _SCHEMA)
+        # Caches made before a digest was added lack its column
+        existing = {row[1] for row in _connection.execute("PRAGMA table_info(file_hashes)")}
+        for column in HASH_COLUMNS:
+            if column not in existing:
+                _connection.execute(f"ALTER TABLE file_hashes ADD COLUMN {column} TEXT")
+    return _connection
+
+
+def file_key(file_path: str) -> tuple:
+    """(path, size, mtime, inode) a cached digest is only valid for."""
+    stat = os.stat(file_path)
+    return os.path.normcase(os.path.abspath(file_path)), stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def lookup(file_paths, column: str) -> dict:
+    """
+    Cached digests of the files that didn't change since they were hashed.
+
+    Args:
+        file_paths: Files to look up
+        column: One of HASH_COLUMNS
+
+    Returns:
+        dict: file path -> digest, files that need hashing are missing
+    """
+    connection = _db()
+    digests = {}
+    for file_path in file_paths:
+        try:
+            key = file_key(file_path)
+        except OSError:
+            continue
+        row = connection.execute(
+            f"SELECT {column} FROM file_hashes WHERE path = ? AND size = ? AND mtime = ? AND inode = ?", key
+        ).fetchone()
+        if row is not None and row[0] is not None:
+            digests[file_path] = row[0]
+    return digests
+
+
+def store(digests: dict, column: str):
+    """
+    Remember freshly computed digests, digests is a dict of file path -> digest.
+
+    Other digests of the same file are kept if it didn't change in between, dropped otherwise.
+    """
+    others = [other for other in HASH_COLUMNS if other != column]
+    # SET expressions see the row from before the update
+    keep_others = ", ".join(
+        f"{other} = CASE WHEN size = excluded.size AND mtime = excluded.mtime AND inode = excluded.inode THEN {other} END"
+        for other in others
+    )
+    statement = (
+        f"INSERT INTO file_hashes (path, size, mtime, inode, {column}) VALUES (?, ?, ?, ?, ?) "
+        f"ON CONFLICT (path) DO UPDATE SET {keep_others}, size = excluded.size, mtime = excluded.mtime, "
+        f"inode = excluded.inode, {column} = excluded.{column}"
+    )
+
+    rows = []
+    for file_path, digest in digests.items():
+        try:
+            rows.append((*file_key(file_path), digest))
+        except OSError:
+            continue
+    connection = _db()
+    with connection:
+        connection.executemany(statement, rows)
+
+
+def cached_hash(file_path: str, column: str, hash_function) -> str:
+    """Digest of a single file, hash_function(file_path) only runs if the cache has none for its current state."""
+    digest = lookup([file_path], column).get(file_path)
+    if digest is None:
+        digest = hash_function(file_path)
+        store({file_path: digest}, column)
+    return digest
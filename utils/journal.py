@@ -0,0 +1,82 @@
+import json
+import os
+import time
+import xxhash
+from utils.cache import cache_path
+
+# Force the journal to disk at most this often, flushing alone survives an app crash
+FSYNC_INTERVAL = 2.0
+
+
+class OperationJournal:
+    """
+    Append-only record of the files a long running operation already finished.
+
+    Each operation/folder pair gets its own journal in the cache folder. Entries are
+    keyed by the path relative to the folder and hold whatever outcome the operation
+    needs to pick up where it stopped. Call finish() once the operation completed so
+    the next run starts from scratch again.
+    """
+
+    def __init__(self, folder: str, operation: str, resume: bool = True):
+        self.folder = os.path.abspath(folder)
+        key = xxhash.xxh64(f"{os.path.normcase(self.folder)}|{operation}".encode()).hexdigest()
+        self.path = cache_path(f"journal_{key}.jsonl")
+        self.entries = {}
+        self._last_sync = time.time()
+
+        if resume:
+            self._load()
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Partially written last line from a crash
+                    continue
+                self.entries[entry.pop("file")] = entry
+
+    def relpath(self, file_path: str) -> str:
+        return os.path.relpath(os.path.abspath(file_path), self.folder)
+
+    def get(self, file_path: str) -> dict | None:
+        """Outcome recorded for this file in an earlier run, or None if it still has to be done."""
+        return self.entries.get(self.relpath(file_path))
+
+    def items(self):
+        """(absolute path, outcome) of every recorded file."""
+        for rel_path, entry in self.entries.items():
+            yield os.path.join(self.folder, rel_path), entry
+
+    def record(self, file_path: str, **outcome):
+        rel_path = self.relpath(file_path)
+        self.entries[rel_path] = outcome
+        self._file.write(json.dumps({"file": rel_path, **outcome}) + "\n")
+        self._file.flush()
+        if time.time() - self._last_sync >= FSYNC_INTERVAL:
+            os.fsync(self._file.fileno())
+            self._last_sync = time.time()
+
+    def forget(self, file_path: str):
+        """Drop an entry that turned out to be stale, it's only removed from memory until the next record."""
+        self.entries.pop(self.relpath(file_path), None)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def finish(self):
+        """The operation completed, remove the journal."""
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,98 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import redirect_stdout
+from io import StringIO
+
+
+def default_worker_count() -> int:
+    """Number of worker processes to use when none is configured, leaves one core for the UI."""
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def _run_captured(fn, args):
+    # Worker processes don't share the UI's stdout redirect, so collect the
+    # output here and let the parent print it.
+    output = StringIO()
+    with redirect_stdout(output):
+        result = fn(*args)
+    return result, output.getvalue()
+
+
+def _run_direct(fn, args):
+    # Threads share stdout with the caller, nothing to collect
+    return fn(*args), None
+
+
+def run_parallel(fn, items, workers=1, progress_callback=None, threads=False, ordered=False):
+    """
+    Run fn(*args) for every args tuple in items and yield the results as they complete.
+
+    Args:
+        fn: Module level function to call, must be picklable for the process pool
+        items: List of argument tuples
+        workers: Number of workers, 1 or less runs everything in this process
+        progress_callback: Optional callback(current, total) for progress updates
+        threads: Use a thread pool instead of processes, for work that mostly waits
+            on external programs like ffmpeg
+        ordered: Yield the results in the order of items instead of as they complete
+
+    Output printed by fn inside a worker process is printed again in this process so
+    it ends up in the same log as the serial path. Threads print directly.
+    """
+    total = len(items)
+    processed = 0
+
+    if workers is None or workers <= 1 or total <= 1:
+        for args in items:
+            result = fn(*args)
+            processed += 1
+            if progress_callback:
+                progress_callback(processed, total)
+            yield result
+        return
+
+    if threads:
+        executor = ThreadPoolExecutor(max_workers=min(workers, total))
+        submit = lambda args: executor.submit(_run_direct, fn, args)
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(workers, total))
+        submit = lambda args: executor.submit(_run_captured, fn, args)
+
+    # Keep a bounded number of files in flight so huge folders don't queue
+    # tens of thousands of futures at once.
+    max_pending = workers * 4
+    pending = {}
+    queue = enumerate(items)
+    # Finished results waiting for an earlier item when ordered
+    finished = {}
+    next_index = 0
+
+    with executor:
+        for index, args in queue:
+            pending[submit(args)] = index
+            if len(pending) >= max_pending:
+                break
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                result, output = future.result()
+                if output:
+                    print(output, end="")
+                processed += 1
+                if progress_callback:
+                    progress_callback(processed, total)
+                if not ordered:
+                    yield result
+                    continue
+
+                finished[index] = result
+                while next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+
+            for index, args in queue:
+                pending[submit(args)] = index
+                if len(pending) >= max_pending:
+                    break
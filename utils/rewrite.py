@@ -0,0 +1,152 @@
+import os
+import re
+
+# Text files that can reference other addon files by name
+REWRITE_FILETYPES = ("lua", "txt", "json")
+# Runs of the characters paths are made of
+_PATH_TOKEN = re.compile(r"[\w./\\-]+", re.ASCII)
+_PATH_TOKEN_BYTES = re.compile(rb"[\w./\\-]+")
+
+
+def path_key(path: str) -> str:
+    """Lowercase path with single forward slashes, how a path is looked up when matching whole paths."""
+    key = path.lower().replace("\\", "/")
+    # Lua strings escape backslashes, "a\\x.wav"
+    while "//" in key:
+        key = key.replace("//", "/")
+    return key
+
+
+def is_path_token(path: str) -> bool:
+    """True if path is made of the characters whole-path matching looks for, see compile_replacements."""
+    return _PATH_TOKEN.fullmatch(path) is not None
+
+
+def referenced_paths(contents, keys) -> set[str]:
+    """
+    Path keys in keys that contents refers to, as a whole path or the end of a longer one.
+
+    Eg "../sound/a/x.wav" refers to "sound/a/x.wav" and "a/x.wav". Each path-like run of
+    contents is looked up in the set, so the scan is linear in the text whatever the number
+    of keys. contents can be text or the bytes of a binary file.
+
+    Args:
+        contents: str or bytes to search
+        keys: Set of path keys, see path_key
+    """
+    tokens = _PATH_TOKEN_BYTES.findall(contents) if isinstance(contents, bytes) else _PATH_TOKEN.findall(contents)
+    found = set()
+    for token in set(tokens):
+        key = path_key(token.decode("ascii") if isinstance(token, bytes) else token)
+        while True:
+            if key in keys:
+                found.add(key)
+            slash = key.find("/")
+            if slash == -1:
+                break
+            key = key[slash + 1:]
+    return found
+
+
+def compile_replacements(replacements: dict[str, str], boundaries: bool = False):
+    """
+    Compile old -> new names into a lookup that rewrites a text in one scan.
+
+    Without boundaries every name needs an extension and matches anywhere in the text, like the
+    old one re.sub per name loop. Only the text in front of each occurrence of a known extension
+    is looked up, once per distinct name length, longest first so "ba.wav" wins over "a.wav".
+
+    With boundaries, a name only matches as a whole path, not as part of a longer one, eg "a/x"
+    doesn't match inside "a/x2" or "b/a/x". Every path-like run of the text is looked up as is,
+    backslashes and slashes are interchangeable.
+
+    Names that only differ in case use the first replacement given.
+
+    Returns:
+        tuple: (boundaries, old name key -> new name, name lengths longest first, lowercase extensions)
+    """
+    lookup = {}
+    for old, new in replacements.items():
+        lookup.setdefault(path_key(old) if boundaries else old.lower(), new)
+
+    extensions = {os.path.splitext(old)[1] for old in lookup}
+    if not boundaries and "" in extensions:
+        raise ValueError("Names without an extension can only be matched as whole paths")
+    lengths = sorted({len(old) for old in lookup}, reverse=True)
+    return boundaries, lookup, lengths, extensions
+
+
+def rewrite_text(contents: str, compiled) -> str:
+    """Replace every old name in contents in a single scan."""
+    boundaries, lookup, lengths, extensions = compiled
+    if boundaries:
+        return _PATH_TOKEN.sub(lambda match: lookup.get(path_key(match.group(0)), match.group(0)), contents)
+
+    lowered = contents.lower()
+    if len(lowered) != len(contents):
+        # A few characters lowercase to two, keep the positions of both texts the same
+        lowered = "".join(char.lower() if len(char.lower()) == 1 else char for char in contents)
+    ends = set()
+    for extension in extensions:
+        end = lowered.find(extension)
+        while end != -1:
+            end += len(extension)
+            ends.add(end)
+            end = lowered.find(extension, end)
+
+    pieces = []
+    last = 0
+    for end in sorted(ends):
+        for length in lengths:
+            start = end - length
+            if start < last:
+                continue
+            new = lookup.get(lowered[start:end])
+            if new is not None:
+                pieces.append(contents[last:start])
+                pieces.append(new)
+                last = end
+                break
+    if not pieces:
+        return contents
+    pieces.append(contents[last:])
+    return "".join(pieces)
+
+
+def rewrite_references(folder, replacements: dict[str, str], filetypes=REWRITE_FILETYPES, boundaries: bool = False) -> int:
+    """
+    Rewrite references to renamed files in the lua/txt/json files of a folder.
+
+    Args:
+        folder: Path to walk
+        replacements: Old file name -> new file name, matched case-insensitively anywhere in the text
+        filetypes: Extensions of the files to rewrite
+        boundaries: Only replace whole paths, see compile_replacements
+
+    Returns:
+        int: Number of files that were changed
+    """
+    if not replacements:
+        return 0
+
+    compiled = compile_replacements(replacements, boundaries)
+    rewritten_count = 0
+    for path, subdirs, files in os.walk(folder):
+        for name in files:
+            filepath = os.path.join(path, name)
+            filetype = name.split(".")[-1]
+            if filetype not in filetypes:
+                continue
+
+            with open(filepath, "r", encoding="utf-8") as f:
+                contents = f.read()
+
+            new_contents = rewrite_text(contents, compiled)
+            if new_contents == contents:
+                continue
+
+            with open(filepath, "w", encoding="utf-8") as f:
+                f.write(new_contents)
+            rewritten_count += 1
+            print("Replaced", filepath, "successfully.")
+    return rewritten_count
@@ -1,9 +1,17 @@
 import glob
-from typing import List, Set
+from typing import Dict, NamedTuple
 import sourcepp
 import os
 
-def get_vpk_files(gamefolder: str) -> Set[str]:
+
+class VPKEntry(NamedTuple):
+    vpk: "sourcepp.vpkpp.VPK"
+    # Size and CRC32 of the file as stored in the VPK directory
+    length: int
+    crc32: int
+
+
+def get_vpk_files(gamefolder: str) -> Dict[str, VPKEntry]:
     """
     Get all file paths from VPK files in the game folder.
 
@@ -11,7 +19,7 @@ def get_vpk_files(gamefolder: str) -> Set[str]:
         gamefolder: Path to the game folder containing VPK files
 
     Returns:
-        Set of file paths found in all VPK files
+        Dict of the file paths found in all VPK files to their VPK and directory entry
     """
     print("Getting files from VPK archives...")
 
@@ -48,13 +56,13 @@ def get_vpk_files(gamefolder: str) -> Set[str]:
             def collect_files(path: str, entry) -> None:
                 nonlocal file_count
                 path = os.path.normpath(path)
-                collected_files.append(path)
+                collected_files.append((path, entry.length, entry.crc32))
                 file_count += 1
 
             # Open the VPK and iterate through all files
             vpk = sourcepp.vpkpp.VPK.open(vpk_path, collect_files)
-            for file_path in collected_files:
-                vpk_files[file_path] = vpk
+            for file_path, length, crc32 in collected_files:
+                vpk_files[file_path] = VPKEntry(vpk, length, crc32)
 
             vpk_count += 1
             print(f"  Found {file_count} files in {os.path.basename(vpk_path)}")